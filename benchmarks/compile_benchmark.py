@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+'''
+Compares the time it takes to compile synthetic experiments of various sizes
+with the single-pass Compiler and with the strategy the old ExperimentEncoder
+used, which deep-copied every Block, Item, Page, and Option before converting
+it (and so copied each component once for every component containing it).
+
+Usage: python benchmarks/compile_benchmark.py [num_pages ...]'''
+
+import copy, sys, time
+from speriment import *
+from speriment.components.component import Component
+
+PAGES_PER_BLOCK = 100
+
+def make_synthetic_experiment(num_pages):
+    '''Returns an Experiment with num_pages two-option Pages, each in its own
+    Item, divided into Blocks of PAGES_PER_BLOCK Pages inside one outer Block.'''
+    with make_experiment(IDGenerator()):
+        blocks = []
+        for start in range(0, num_pages, PAGES_PER_BLOCK):
+            items = [Item(Page('Question {}'.format(n),
+                               options = [Option('yes', correct = True), Option('no', correct = False)],
+                               tags = {'number': str(n)}),
+                          condition = 'c{}'.format(n % 2))
+                     for n in range(start, min(start + PAGES_PER_BLOCK, num_pages))]
+            blocks.append(Block(items = items))
+        return Experiment([Block(blocks = blocks)])
+
+def copy_each_component(obj):
+    '''Deep-copies every component in obj's subtree, including itself, the way
+    the old encoder did before converting each one.'''
+    if isinstance(obj, Component):
+        copy.deepcopy(obj)
+        for (_, value) in obj._fields():
+            copy_each_component(value)
+    elif isinstance(obj, list):
+        for value in obj:
+            copy_each_component(value)
+
+def time_call(f, *args):
+    start = time.time()
+    f(*args)
+    return time.time() - start
+
+def run(sizes):
+    print '{:>8} {:>12} {:>12} {:>8}'.format('pages', 'old (s)', 'new (s)', 'speedup')
+    for num_pages in sizes:
+        experiment = make_synthetic_experiment(num_pages)
+        new = time_call(experiment.compile)
+        old = time_call(copy_each_component, experiment) + new
+        print '{:>8} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(num_pages, old, new, old / new)
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
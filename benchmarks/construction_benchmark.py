@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+'''
+Measures the time and memory it takes to build experiments from a csv file
+with get_dicts, with one Item per row holding a Page with four Options. Each
+size is built in a fresh process so its peak memory can be measured on its
+own.
+
+Usage: python benchmarks/construction_benchmark.py [num_rows ...]'''
+
+import csv, os, resource, subprocess, sys, tempfile, time
+from speriment import *
+
+OPTIONS_PER_PAGE = 4
+
+def write_csv(filename, num_rows):
+    with open(filename, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(['question', 'condition'] + ['option{}'.format(n) for n in range(OPTIONS_PER_PAGE)])
+        for row in xrange(num_rows):
+            writer.writerow(['Question {}'.format(row), 'c{}'.format(row % 4)] +
+                    ['answer {} {}'.format(row, n) for n in range(OPTIONS_PER_PAGE)])
+
+def build(filename):
+    '''Returns an Experiment made from the rows of the csv filename.'''
+    with make_experiment(IDGenerator()):
+        items = [Item(Page(row['question'],
+                           options = [Option(row['option{}'.format(n)], correct = n == 0)
+                                      for n in range(OPTIONS_PER_PAGE)],
+                           tags = {'row': str(i)}),
+                      condition = row['condition'])
+                 for (i, row) in enumerate(get_dicts(filename))]
+        return Experiment([Block(items = items)])
+
+def measure(filename):
+    '''Builds an experiment from filename and prints the seconds it took and
+    the growth in peak memory, in MB.'''
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    experiment = build(filename)
+    seconds = time.time() - start
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print seconds, (after - before) / 1024.0
+
+def run(sizes):
+    print '{:>8} {:>10} {:>12}'.format('rows', 'time (s)', 'memory (MB)')
+    for num_rows in sizes:
+        filename = os.path.join(tempfile.mkdtemp(), 'rows.csv')
+        write_csv(filename, num_rows)
+        output = subprocess.check_output([sys.executable, __file__, '--measure', filename])
+        (seconds, megabytes) = map(float, output.split())
+        print '{:>8} {:>10.2f} {:>12.1f}'.format(num_rows, seconds, megabytes)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--measure']:
+        measure(sys.argv[2])
+    else:
+        run([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+'''
+Compares making Items from a table row by row, as in doc/example.py, with
+items_from_frame. Uses a pandas DataFrame if pandas is installed, and a
+dictionary of columns otherwise.
+
+Usage: python benchmarks/frame_benchmark.py [num_rows ...]'''
+
+import sys, time
+from speriment import *
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+def make_frame(num_rows):
+    columns = {
+        'Question': ['Question {}'.format(n) for n in xrange(num_rows)],
+        'Option1': ['yes {}'.format(n) for n in xrange(num_rows)],
+        'Option2': ['no {}'.format(n) for n in xrange(num_rows)],
+        'Condition': ['c{}'.format(n % 4) for n in xrange(num_rows)],
+        'List': [str(n % 2) for n in xrange(num_rows)]}
+    return pd.DataFrame(columns) if pd is not None else columns
+
+def rows(frame):
+    if pd is not None:
+        return frame.to_dict('records')
+    return [dict(zip(frame.keys(), values)) for values in zip(*frame.values())]
+
+def by_row(frame):
+    with make_experiment(IDGenerator()):
+        return [Item(Page(row['Question'], options = [Option(row['Option1']), Option(row['Option2'])]),
+                     condition = row['Condition'], tags = {'List': row['List']})
+                for row in rows(frame)]
+
+def bulk(frame):
+    with make_experiment(IDGenerator()):
+        return items_from_frame(frame, text = 'Question', options = ['Option1', 'Option2'],
+                condition = 'Condition', tags = ['List'])
+
+def time_call(f, *args):
+    start = time.time()
+    f(*args)
+    return time.time() - start
+
+def run(sizes):
+    print '{:>8} {:>12} {:>12} {:>8}'.format('rows', 'by row (s)', 'bulk (s)', 'speedup')
+    for num_rows in sizes:
+        frame = make_frame(num_rows)
+        old = time_call(by_row, frame)
+        new = time_call(bulk, frame)
+        print '{:>8} {:>12.2f} {:>12.2f} {:>8.1f}'.format(num_rows, old, new, old / new)
+
+if __name__ == '__main__':
+    run([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+'''
+Measures how long `import speriment` takes in a fresh process, over the time
+it takes to start Python at all, and lists the modules that took longest to
+import, as python3 -X importtime would. Modules that are only needed for
+validating, caching, bundling, or compiling in parallel should be imported
+when they're first used, not here; any of HEAVY_MODULES that are imported
+anyway are reported.
+
+Usage: python benchmarks/import_benchmark.py [runs]'''
+
+import json, os, subprocess, sys, time
+
+# modules that import speriment shouldn't load
+HEAVY_MODULES = ['jsonschema', 'pkg_resources', 'multiprocessing', 'hashlib', 'shutil']
+
+# run in each child: times every import, including the time of the imports
+# it makes, and reports them along with which heavy modules were loaded
+PROFILE = '''
+import __builtin__, json, sys, time
+times = {}
+original_import = __builtin__.__import__
+def timed_import(name, *args, **kwargs):
+    start = time.time()
+    try:
+        return original_import(name, *args, **kwargs)
+    finally:
+        times[name] = times.get(name, 0) + time.time() - start
+__builtin__.__import__ = timed_import
+start = time.time()
+import speriment
+total = time.time() - start
+__builtin__.__import__ = original_import
+print json.dumps({'total': total, 'times': times,
+    'heavy': [name for name in %r if name in sys.modules]})
+'''
+
+def environment():
+    '''Returns the environment for child processes, in which speriment is
+    imported from this checkout.'''
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([root] + filter(None, [env.get('PYTHONPATH')]))
+    return env
+
+def startup_time(code, env):
+    '''Returns the wall time of running code in a fresh interpreter.'''
+    start = time.time()
+    subprocess.check_call([sys.executable, '-c', code], env = env)
+    return time.time() - start
+
+def measure(runs = 5):
+    '''Returns (the best time of import speriment over the time to start
+    Python, the profile of the fastest run), over runs runs.'''
+    env = environment()
+    baseline = min(startup_time('pass', env) for _ in range(runs))
+    best = None
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', PROFILE % HEAVY_MODULES], env = env)
+        profile = json.loads(output)
+        if best is None or profile['total'] < best['total']:
+            best = profile
+    full = min(startup_time('import speriment', env) for _ in range(runs))
+    return (full - baseline, best)
+
+def run(runs):
+    (overhead, profile) = measure(runs)
+    print 'import speriment: {:.3f} s over startup ({:.3f} s measured in process)'.format(
+            overhead, profile['total'])
+    print '{:>10}  {}'.format('time (s)', 'module, including what it imports')
+    for (name, seconds) in sorted(profile['times'].iteritems(), key = lambda p: -p[1])[:15]:
+        print '{:>10.4f}  {}'.format(seconds, name)
+    if profile['heavy']:
+        print 'imported eagerly: {}'.format(', '.join(profile['heavy']))
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+'''
+Compares writing and loading synthetic trial data as csv, the way
+speriment-output always used to, with parquet and feather. Loading the csv
+includes parsing its list columns back into lists, which the columnar formats
+don't need.
+
+Needs pandas, pyarrow, and speriment-output's own dependencies.
+
+Usage: python benchmarks/output_benchmark.py [num_trials]'''
+
+import ast, imp, os, sys, tempfile, time
+import pandas as pd
+
+output = imp.load_source('speriment_output',
+        os.path.join(os.path.dirname(__file__), '..', 'bin', 'speriment-output'))
+
+TRIALS_PER_PARTICIPANT = 200
+LIST_COLUMNS = ['BlockIDs', 'OptionOrder', 'OptionTexts', 'OptionResources',
+        'PageResources', 'SelectedID', 'SelectedPosition', 'SelectedText', 'Correct',
+        'optiontag']
+
+def make_trials(num_trials):
+    '''Yields num_trials trials shaped like the ones Speriment records.'''
+    for n in xrange(num_trials):
+        (participant, trial_number) = divmod(n, TRIALS_PER_PARTICIPANT)
+        start = 1430000000000 + n * 2000
+        yield {
+            'PageID': 'page{}'.format(trial_number),
+            'PageText': 'Question {}'.format(trial_number),
+            'PageResources': ['picture{}.jpg'.format(trial_number % 10)],
+            'ItemID': 'item{}'.format(trial_number),
+            'BlockIDs': ['outer', 'block{}'.format(trial_number // 50)],
+            'StartTime': start,
+            'EndTime': start + 500 + n % 1500,
+            'Iteration': 1,
+            'Condition': 'c{}'.format(trial_number % 2),
+            'OptionOrder': ['yes{}'.format(trial_number), 'no{}'.format(trial_number)],
+            'OptionTexts': ['yes', 'no'],
+            'OptionResources': [[], []],
+            'SelectedID': ['yes{}'.format(trial_number)],
+            'SelectedPosition': [n % 2],
+            'SelectedText': ['yes'],
+            'Correct': [n % 3 != 0],
+            'UniqueID': 'HIT{0}:WORKER{0}'.format(participant),
+            'TrialNumber': trial_number,
+            'Version': participant % 4,
+            'Permutation': participant % 2,
+            'HIT': 'HIT{}'.format(participant),
+            'WorkerID': 'WORKER{}'.format(participant),
+            'ExperimentVersion': '1.0',
+            'number': str(trial_number),
+            'optiontag': ['a', 'NA']
+            }
+
+def load_csv(filename):
+    data_frame = pd.read_csv(filename, index_col = 0)
+    for column in LIST_COLUMNS:
+        data_frame[column] = data_frame[column].map(ast.literal_eval)
+    return data_frame
+
+def time_call(f, *args):
+    start = time.time()
+    f(*args)
+    return time.time() - start
+
+def run(num_trials):
+    directory = tempfile.mkdtemp()
+    print '{:>8} {:>10} {:>10} {:>10}'.format('format', 'write (s)', 'load (s)', 'size (MB)')
+    writers = [
+        ('csv', lambda f: output.python_dataframe(make_trials(num_trials), f, 10000), load_csv),
+        ('parquet', lambda f: output.write_arrow(make_trials(num_trials), f, 'parquet', 10000), pd.read_parquet),
+        ('feather', lambda f: output.write_arrow(make_trials(num_trials), f, 'feather', 10000), pd.read_feather)]
+    for (name, write, load) in writers:
+        filename = os.path.join(directory, 'trials.' + name)
+        write_time = time_call(write, filename)
+        load_time = time_call(load, filename)
+        size = os.path.getsize(filename) / 1e6
+        print '{:>8} {:>10.2f} {:>10.2f} {:>10.1f}'.format(name, write_time, load_time, size)
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
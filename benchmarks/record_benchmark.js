@@ -0,0 +1,83 @@
+/*
+ * Simulates a participant's session in a training block with a criterion,
+ * checking whether the block should loop after every trial the way
+ * Block.shouldLoop does, and RunIf lookups as later blocks would. Times the
+ * indexed ExperimentRecord against scanning every record, which is what
+ * getBlockGrades used to do, and checks that the two agree.
+ *
+ * Needs the compiled javascript/speriment.js (npm run prepublish) and
+ * underscore.
+ *
+ * Usage: node benchmarks/record_benchmark.js [num_trials] [num_pages]
+ */
+
+var fs = require('fs'),
+    path = require('path'),
+    vm = require('vm');
+
+global._ = require('underscore');
+vm.runInThisContext(fs.readFileSync(path.join(__dirname, '..', 'javascript', 'speriment.js'), 'utf8'));
+
+var numTrials = parseInt(process.argv[2] || '5000'),
+    numPages = parseInt(process.argv[3] || '100'),
+    blockIDs = ['outer', 'training'];
+
+// what getBlockGrades did before records were indexed
+function scanGrades(experimentRecord, blockID){
+    var recentRecords = _.map(experimentRecord.trialRecords, function(tr){return _.last(tr);});
+    var relevantRecords = _.filter(recentRecords, function(tr){return tr.inBlock(blockID);});
+    relevantRecords.sort(function(r1, r2){return r1.getStartTime() - r2.getStartTime();});
+    var grades = _.flatten(_.pluck(relevantRecords, 'correct'));
+    return _.reject(grades, function(g){return _.isNull(g) || _.isUndefined(g);});
+}
+
+function scanMetrics(experimentRecord, blockID){
+    var grades = scanGrades(experimentRecord, blockID);
+    return [_.compact(grades).length / grades.length, grades.length - (_.lastIndexOf(grades, false) + 1)];
+}
+
+function indexedMetrics(experimentRecord, blockID){
+    return [experimentRecord.getPercentCorrect(blockID), experimentRecord.getStreak(blockID)];
+}
+
+// a trial on page n; some pages have no correct answer, some allow more than
+// one response, and later iterations are more often correct
+function makeTrial(n, time, iteration){
+    var record = new TrialRecord('p' + n, 'page ' + n, 'c' + (n % 2), 'i' + n, {}, blockIDs, {}, []);
+    var correct;
+    if (n % 10 === 0){
+        correct = [null];
+    } else if (n % 7 === 0){
+        correct = [Math.random() < 0.8, Math.random() < 0.8];
+    } else {
+        correct = [Math.random() < Math.min(0.95, 0.5 + iteration / 10)];
+    }
+    var selected = _.map(correct, function(c, i){return 'p' + n + 'o' + i;});
+    record.setStartTime(time);
+    record.addResponseData(_.range(correct.length), selected, selected, correct);
+    return record;
+}
+
+function run(metrics, check){
+    var experimentRecord = new ExperimentRecord(null, 0),
+        results = [],
+        start = Date.now();
+    for (var t = 0; t < numTrials; t++){
+        var n = t % numPages;
+        experimentRecord.addRecord(makeTrial(n, t, Math.floor(t / numPages)));
+        results.push(metrics(experimentRecord, 'training'));
+        experimentRecord.responseGiven('p' + n, 'p' + n + 'o0');
+        if (check){
+            var expected = scanMetrics(experimentRecord, 'training');
+            if (!_.isEqual(expected, results[t])){
+                throw 'trial ' + t + ': expected ' + expected + ' but got ' + results[t];
+            }
+        }
+    }
+    return (Date.now() - start) / 1000;
+}
+
+run(indexedMetrics, true);
+console.log(numTrials + ' trials on ' + numPages + ' pages: indexed and scanned grades agree');
+console.log('scanning every record: ' + run(scanMetrics, false).toFixed(3) + ' s');
+console.log('indexed records:       ' + run(indexedMetrics, false).toFixed(3) + ' s');
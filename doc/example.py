@@ -31,6 +31,11 @@ materials1 = get_rows('items1.csv')
 # which is passed to the csv package as the delimiter
 materials2 = get_dicts('items2.csv', sep = '\t')
 
+# for very large files, iter_rows and iter_dicts read one row at a time
+# instead of keeping the whole file in memory. Use them in a generator
+# expression to make your items, like
+# Block(items = (Item(Page(row['Question'])) for row in iter_dicts('items2.csv', sep = '\t')))
+
 
 ##### IDs #######
 
@@ -13,7 +13,7 @@ setup(name='speriment',
       keywords=['experiments psychology linguistics'],
       packages=find_packages(exclude=['contrib', 'docs', 'tests']),
       package_data={'speriment.components': ['sperimentschema.json']},
-      scripts=['bin/speriment-output'],
+      scripts=['bin/speriment-output', 'bin/speriment-serve'],
       install_requires=['jsonschema'],
       include_package_data=True,
       zip_safe=False)
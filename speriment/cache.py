@@ -0,0 +1,225 @@
+import hashlib, json, os, types
+from collections import Counter, OrderedDict
+from speriment.compiler import Precompiled, attributes
+from speriment.schema import get_schema, CONTENT_DEFINITIONS
+from speriment.components.item import Item
+from speriment.components.block import Block
+from speriment.components.run_if import RunIf
+from speriment.components.sample_from import SampleFrom
+
+__all__ = []
+
+# Change this whenever the compiled form of a component changes, so that
+# entries made by older versions of Speriment aren't reused.
+CACHE_VERSION = '2'
+
+class SubtreeCache(object):
+    '''Stores the compiled form of Items and Blocks on disk, keyed by a hash of
+    everything their compiled form depends on, so that unchanged ones can be
+    reused verbatim by later compilations instead of being compiled and
+    validated again.
+
+    An Item's entry holds its compiled form. A Block's entry holds its compiled
+    form with the Items and Blocks it contains replaced by references to their
+    own entries, so an entry is written once per subtree rather than once per
+    enclosing Block.
+
+    Entries are only reused once they have been committed, which should be
+    done after the compiled experiment passes schema validation.'''
+
+    def __init__(self, directory, keep_entries = 0):
+        '''directory: string, the directory to keep entries in. It is created
+        if it doesn't exist.
+
+        keep_entries: integer, optional. If given, up to this many entries are
+        kept in memory once they've been read, the least recently used being
+        dropped first, for a cache that is used for many compilations, as by
+        a CompileService. Entries never change once written, since their keys
+        are hashes of everything they depend on.'''
+        self.directory = directory
+        self.keep_entries = keep_entries
+        self.entries = OrderedDict() if keep_entries else None # {key: entry}, most recently used last
+        self.fingerprints = Fingerprints()
+        self.salt = CACHE_VERSION + hashlib.sha1(json.dumps(get_schema(), sort_keys = True)).hexdigest()
+        self.index_filename = os.path.join(directory, 'index.json')
+        if os.path.exists(self.index_filename):
+            with open(self.index_filename) as f:
+                self.committed = set(json.load(f))
+        else:
+            self.committed = set()
+        self.used = set()
+
+    def start(self):
+        '''Prepares to compile another experiment through this cache. The
+        fingerprints of the last one's components are forgotten, since they
+        may have changed or been freed and their IDs reused.'''
+        self.fingerprints = Fingerprints()
+        self.used = set()
+
+    def stores(self, component):
+        return isinstance(component, (Item, Block))
+
+    def compile(self, component, compiler, **kwargs):
+        '''Returns the compiled form of component as a Precompiled, reusing a
+        committed entry if there is one and otherwise compiling it and
+        storing the result.'''
+        (fingerprint, samplers) = self.fingerprints.get(component, compiler)
+        key = hashlib.sha1(json.dumps([
+            self.salt,
+            fingerprint,
+            self.fingerprints.describe(kwargs, compiler, Counter()),
+            # SampleFroms without variables are numbered in compilation order
+            [(bank, compiler.sampler_generator(bank)._current()) for bank in sorted(samplers)]
+        ])).hexdigest()
+        if key in self.committed:
+            for (bank, count) in samplers.iteritems():
+                compiler.sampler_generator(bank).current_id += count
+            return self._load(key, compiler.lazy)
+        return self._store(key, compiler.compile_component(component, **kwargs))
+
+    def commit(self):
+        '''Marks the entries used by this compilation as reusable.'''
+        self.committed |= self.used
+        partial_filename = self.index_filename + '.partial'
+        with open(partial_filename, 'w') as f:
+            json.dump(sorted(self.committed), f)
+        os.rename(partial_filename, self.index_filename)
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def _store(self, key, compiled):
+        '''Writes compiled to the entry for key, and returns it as a
+        Precompiled. If it's a lazily compiled Block, the entry is written
+        once its contents have all been compiled.'''
+        self.used.add(key)
+        stored = Precompiled(compiled, key, False)
+        lazy = [name for (name, value) in compiled.iteritems() if isinstance(value, types.GeneratorType)]
+        if not lazy:
+            self._write(key, self._entry(compiled))
+        for name in lazy:
+            stored[name] = self._store_contents(key, compiled, name)
+        return stored
+
+    def _store_contents(self, key, compiled, name):
+        references = []
+        for content in compiled[name]:
+            references.append(self._references(content))
+            yield content
+        entry = self._entry(dict([(k, v) for (k, v) in compiled.iteritems() if k != name]))
+        entry[name] = references
+        self._write(key, entry)
+
+    def _entry(self, compiled):
+        return dict([(k, self._references(v)) for (k, v) in compiled.iteritems()])
+
+    def _references(self, value):
+        '''Returns value with the Precompiled components it contains replaced
+        by references to their entries.'''
+        if isinstance(value, Precompiled):
+            return {'$cached': value.key}
+        elif isinstance(value, dict):
+            return self._entry(value)
+        elif isinstance(value, list):
+            return [self._references(v) for v in value]
+        else:
+            return value
+
+    def _write(self, key, entry):
+        filename = self._filename(key)
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        # entries are replaced atomically, since other processes compiling the
+        # same experiment may be reading or writing them
+        partial_filename = '{}.{}.partial'.format(filename, os.getpid())
+        with open(partial_filename, 'w') as f:
+            json.dump(entry, f)
+        os.rename(partial_filename, filename)
+
+    def _load(self, key, lazy):
+        '''Returns the stored compiled form for key, as a validated
+        Precompiled, with references to other entries filled in. If lazy is
+        True, the contents of a Block are loaded only as they're consumed.'''
+        self.used.add(key)
+        entry = self._read(key)
+        loaded = Precompiled({}, key, True)
+        for (name, value) in entry.iteritems():
+            if name in CONTENT_DEFINITIONS and lazy:
+                loaded[name] = (self._resolve(content, lazy) for content in value)
+            else:
+                loaded[name] = self._resolve(value, lazy)
+        return loaded
+
+    def _read(self, key):
+        if self.entries is not None and key in self.entries:
+            entry = self.entries.pop(key)
+            self.entries[key] = entry
+            return entry
+        with open(self._filename(key)) as f:
+            entry = json.load(f)
+        if self.entries is not None:
+            self.entries[key] = entry
+            if len(self.entries) > self.keep_entries:
+                self.entries.popitem(last = False)
+        return entry
+
+    def _resolve(self, value, lazy):
+        if isinstance(value, dict) and '$cached' in value:
+            return self._load(value['$cached'], lazy)
+        elif isinstance(value, dict):
+            return dict([(k, self._resolve(v, lazy)) for (k, v) in value.iteritems()])
+        elif isinstance(value, list):
+            return [self._resolve(v, lazy) for v in value]
+        else:
+            return value
+
+class Fingerprints(object):
+    '''Computes content hashes of Items and Blocks from their attributes,
+    reusing the hashes of the Items and Blocks they contain.'''
+
+    def __init__(self):
+        self.memo = {} # {id(component): (hash, Counter)}
+
+    def get(self, component, compiler):
+        '''Returns the hash of component, and a Counter of how many SampleFroms
+        without variables it contains from each bank.'''
+        if id(component) not in self.memo:
+            samplers = Counter()
+            description = [type(component).__name__, self._attributes(component, compiler, samplers)]
+            fingerprint = hashlib.sha1(json.dumps(description, sort_keys = True)).hexdigest()
+            self.memo[id(component)] = (fingerprint, samplers)
+        return self.memo[id(component)]
+
+    def describe(self, value, compiler, samplers):
+        '''Returns a JSON-serializable description of value that changes
+        whenever its compiled form would, counting SampleFroms without
+        variables in samplers.'''
+        if isinstance(value, (Item, Block)):
+            (fingerprint, contained) = self.get(value, compiler)
+            samplers.update(contained)
+            return fingerprint
+        elif isinstance(value, RunIf):
+            # a RunIf depends only on the IDs of what it refers to
+            return ['RunIf', compiler.compile(value)]
+        elif isinstance(value, SampleFrom):
+            attributes = self._attributes(value, compiler, samplers)
+            for name in ['variable', 'not_variable']:
+                if name in attributes:
+                    attributes[name] = getattr(value, '_{}_index'.format(name))
+            if not [name for name in ['variable', 'not_variable', 'with_replacement'] if name in attributes]:
+                samplers[value.bank] += 1
+            return ['SampleFrom', attributes]
+        elif hasattr(value, '_compile'):
+            return [type(value).__name__, self._attributes(value, compiler, samplers)]
+        elif isinstance(value, (list, tuple)):
+            return [self.describe(v, compiler, samplers) for v in value]
+        elif isinstance(value, dict):
+            return dict([(key, self.describe(v, compiler, samplers)) for (key, v) in value.iteritems()])
+        else:
+            return value
+
+    def _attributes(self, obj, compiler, samplers):
+        # treatments list Blocks that are also among the contents, and are only
+        # compiled there
+        return dict([(key, self.describe(value, compiler, Counter() if key == 'treatments' else samplers))
+            for (key, value) in attributes(obj)])
@@ -1,16 +1,135 @@
-import json, copy
+import json, types
+from speriment.utils import IDGenerator
 
 __all__ = []
 
-class ExperimentEncoder(json.JSONEncoder):
-    '''This class enables nested Python objects to be correctly serialized to JSON.
-    It also requires that non-schema validation pass before the JSON is
-    generated.'''
-    def default(self, obj):
-        obj._validate()
-        new_obj = copy.deepcopy(obj)
-        try:
-            return new_obj.comp().__dict__
-        except:
-            # Let the base class default method raise the TypeError
-            return json.JSONEncoder.default(self, new_obj.__dict__)
+class Compiler(object):
+    '''Walks an Experiment once, validating each component it meets and
+    building the dictionaries that make up its JSON representation. Components
+    are read but never copied or modified, so an Experiment can be compiled
+    any number of times.
+
+    Each class that appears in an Experiment (Components, RunIf, SampleFrom,
+    Resource) defines _validate, _compile, which takes a Compiler and returns
+    a dictionary, and optionally _json_names, which maps its attribute names
+    to the names they're given in the JSON.'''
+
+    def __init__(self, sampler_generators, lazy = False, cache = None):
+        '''sampler_generators: {string: IDGenerator}, a copy of the generators
+        the experiment's SampleFroms used to number their variables, by bank,
+        used to give a fresh variable to each SampleFrom that doesn't have one.
+
+        lazy: boolean, optional. If True, the contents of Experiments and Blocks
+        are compiled only as they're consumed, for use with write_json.
+
+        cache: SubtreeCache, optional. If given, Items and Blocks are compiled
+        through it, so unchanged ones are reused from an earlier compilation.'''
+        self.sampler_generators = sampler_generators
+        self.lazy = lazy
+        self.cache = cache
+
+    def compile(self, value, **kwargs):
+        '''Returns the JSON-ready equivalent of value. Lists and dictionaries
+        are compiled element by element and anything else that isn't an
+        experimental component is returned as is. Keyword arguments are passed
+        on to the component's _compile method.'''
+        if hasattr(value, '_compile'):
+            if self.cache is not None and self.cache.stores(value):
+                return self.cache.compile(value, self, **kwargs)
+            return self.compile_component(value, **kwargs)
+        elif isinstance(value, (list, tuple)):
+            return [self.compile(v) for v in value]
+        elif isinstance(value, dict):
+            return dict([(key, self.compile(v)) for (key, v) in value.iteritems()])
+        else:
+            return value
+
+    def sampler_generator(self, bank):
+        '''Returns the generator of fresh variables for bank, which starts
+        from 0 if no SampleFrom on bank has a variable.'''
+        if bank not in self.sampler_generators:
+            self.sampler_generators[bank] = IDGenerator()
+        return self.sampler_generators[bank]
+
+    def compile_component(self, component, **kwargs):
+        '''Validates and compiles component, bypassing the cache.'''
+        component._validate()
+        return component._compile(self, **kwargs)
+
+    def contents(self, compiled):
+        '''compiled: an iterator that compiles the contents of an Experiment or
+        Block one at a time. Returns it as is if compiling lazily and as a list
+        otherwise.'''
+        return compiled if self.lazy else list(compiled)
+
+    def fields(self, obj, skip = ()):
+        '''Returns a dictionary mapping the JSON names of obj's attributes to
+        their compiled values, leaving out the attributes named in skip.'''
+        names = getattr(obj, '_json_names', {})
+        return dict([(names.get(key, key), self.compile(value))
+            for (key, value) in attributes(obj) if key not in skip])
+
+def attributes(obj):
+    '''Returns (name, value) for each attribute of obj. Components keep theirs
+    in slots rather than in __dict__. Attributes whose names start with an
+    underscore aren't part of the experiment.'''
+    if hasattr(obj, '_fields'):
+        return obj._fields()
+    return [(name, value) for (name, value) in obj.__dict__.iteritems()
+        if not name.startswith('_')]
+
+class Precompiled(dict):
+    '''The compiled form of an Item or Block that has been through a
+    SubtreeCache, along with the key it is stored under. If validated is True,
+    it was reused from an earlier compilation and has already passed schema
+    validation.'''
+
+    def __init__(self, compiled, key, validated):
+        super(Precompiled, self).__init__(compiled)
+        self.key = key
+        self.validated = validated
+
+class RawJSON(str):
+    '''JSON text that write_json writes as is, for values that were serialized
+    elsewhere with the same indent and at the same level.'''
+    pass
+
+def write_json(value, f, indent = None, level = 0):
+    '''Writes value to the file f as JSON, indented by indent spaces per level,
+    or as compactly as possible if indent is None, with keys in sorted order.
+    Generators, which a lazy Compiler makes for the contents of Experiments and
+    Blocks, are written one element at a time, so the whole of value never has
+    to be in memory. level is how deeply value is nested in the JSON it's part
+    of.'''
+    separators = (',', ':') if indent is None else (',', ': ')
+    _write_json(value, f, indent, separators, level)
+
+def _write_json(value, f, indent, separators, level):
+    if isinstance(value, RawJSON):
+        f.write(value)
+        return
+    elif isinstance(value, dict) and any(isinstance(v, types.GeneratorType) for v in value.itervalues()):
+        (opener, closer) = ('{', '}')
+        entries = ((json.dumps(key) + separators[1], v) for (key, v) in sorted(value.iteritems()))
+    elif isinstance(value, types.GeneratorType):
+        (opener, closer) = ('[', ']')
+        entries = (('', v) for v in value)
+    else:
+        text = json.dumps(value, indent = indent, separators = separators, sort_keys = True)
+        if indent is not None and level > 0:
+            text = text.replace('\n', '\n' + ' ' * indent * level)
+        f.write(text)
+        return
+    f.write(opener)
+    empty = True
+    for (prefix, v) in entries:
+        if not empty:
+            f.write(separators[0])
+        empty = False
+        if indent is not None:
+            f.write('\n' + ' ' * indent * (level + 1))
+        f.write(prefix)
+        _write_json(v, f, indent, separators, level + 1)
+    if indent is not None and not empty:
+        f.write('\n' + ' ' * indent * level)
+    f.write(closer)
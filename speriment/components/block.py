@@ -1,9 +1,16 @@
-from component import Component
-from run_if import RunIf
+from component import Component, as_list
+from item import Item
+from sample_from import SampleFrom
 from collections import Counter
 from speriment.utils import exactly_one
 
 class Block(Component):
+    __slots__ = ('pages', 'items', 'groups', 'blocks', 'exchangeable',
+            'counterbalance', 'treatments', 'latin_square', 'pseudorandom',
+            'criterion', 'cutoff', 'banks')
+
+    _json_names = dict(Component._json_names, latin_square = 'latinSquare')
+
     def __init__(self, pages = None, items = None, groups = None, blocks = None, id_str = None,
             exchangeable = [], counterbalance = [], treatments = [], latin_square = None, pseudorandom = None, **kwargs):
         '''
@@ -54,12 +61,13 @@ class Block(Component):
         condition. The condition attribute of Pages is not used to check the
         order.
 
-        pseudorandom: boolean, only valid if contents is [[Pages]] or [Pages],
-        all Pages have a condition attribute specified, and there will be an equal
-        number of each Pages of each condition displayed (therefore it is not
-        valid if contents is [[Pages]] and latin_square is False, because there's
-        no guarantee about how many Pages of each condition will display). If True,
-        no two Pages with the same condition will display in a row.
+        pseudorandom: boolean, only valid if contents is [[Pages]], [Pages], or
+        [Items], all Pages (or Items) have a condition attribute specified, and
+        no condition makes up more than half (rounded up) of the Pages displayed
+        (therefore it is not valid if contents is [[Pages]] and latin_square is
+        False, because there's no guarantee about how many Pages of each
+        condition will display). If True, no two Pages with the same condition
+        will display in a row.
 
         **kwargs: optional keyword arguments, which can include:
 
@@ -101,13 +109,13 @@ class Block(Component):
         self._set_id(id_str)
         self._set_optional_args(**kwargs)
         if pages != None:
-            self.pages = pages
+            self.pages = as_list(pages)
         if items != None:
-            self.items = items
+            self.items = as_list(items)
         if groups != None:
-            self.groups = groups
+            self.groups = [as_list(group) for group in as_list(groups)]
         if blocks != None:
-            self.blocks = blocks
+            self.blocks = as_list(blocks)
         self._validate_contents()
         self._set_optional_args(**kwargs)
 
@@ -133,8 +141,8 @@ class Block(Component):
 
     def _validate(self):
         self._validate_contents()
-        self._validate_pseudorandom()
         self._validate_latin_square()
+        self._validate_pseudorandom()
         self._validate_counterbalancing()
 
     def _validate_counterbalancing(self):
@@ -150,44 +158,94 @@ class Block(Component):
         exactly_one(self, ['pages', 'groups', 'items', 'blocks'])
 
     def _validate_pseudorandom(self):
-        if hasattr(self, 'pseudorandom'):
-            if hasattr(self, 'groups'):
-                if self.latin_square == False:
-                    raise ValueError, '''Can't choose pages from groups randomly and
-                    ensure that pseudorandomization will work. Supply pages instead of
-                    groups, change latin_square to True, or change pseudorandom to
-                    False.'''
-                try:
-                    conditions = [page.condition for group in self.groups for page in
-                        group]
-                except AttributeError:
-                    raise ValueError, '''In block {0}, can't pseudorandomize pages without
-                    conditions.'''.format(self.id_str)
-                cond_counter = Counter(conditions)
-                cond_counts = cond_counter.values()
-                num_cond_counts = len(set(cond_counts))
-                if num_cond_counts != 1:
-                    raise ValueError, '''Can't pseudorandomize pages if not all
-                    conditions are represented the same number of times in the
-                    block.'''
-        #TODO elif hasattr('pages')
+        '''Checks that, for every set of pages this Block can display, no
+        condition makes up more than half (rounded up) of them, so that they
+        can be ordered with no two pages of the same condition in a row.'''
+        if not getattr(self, 'pseudorandom', False):
+            return
+        if hasattr(self, 'groups'):
+            if not getattr(self, 'latin_square', False):
+                raise ValueError, '''Can't choose pages from groups randomly and
+                ensure that pseudorandomization will work. Supply pages instead of
+                groups, change latin_square to True, or change pseudorandom to
+                False.'''
+            # one set of pages per version of the Latin Square
+            displayed = [[group[i] for (group, i) in zip(self.groups, row)]
+                    for row in self._latin_square_table()]
+        elif hasattr(self, 'pages'):
+            displayed = [self.pages]
+        elif hasattr(self, 'items'):
+            displayed = [self.items]
+        else:
+            raise ValueError, '''In block {0}, pseudorandom is only valid if
+            contents are pages, items, or groups.'''.format(self.id_str)
+        for contents in displayed:
+            conditions = [_condition(content) for content in contents]
+            if None in conditions:
+                raise ValueError, '''In block {0}, can't pseudorandomize pages without
+                conditions.'''.format(self.id_str)
+            if not conditions or [c for c in conditions if isinstance(c, SampleFrom)]:
+                # conditions sampled from banks aren't known until runtime
+                continue
+            (condition, count) = Counter(conditions).most_common(1)[0]
+            if count > (len(conditions) + 1) // 2:
+                raise ValueError, '''In block {0}, can't pseudorandomize pages:
+                {1} of the {2} pages displayed have condition {3}, so some would
+                have to appear in a row.'''.format(self.id_str, count,
+                    len(conditions), condition)
 
     def _validate_latin_square(self):
-        pass
-
-    def comp(self):
-        if hasattr(self, 'treatments'):
-            self.compile_treatments()
-        if hasattr(self, 'latin_square'):
-            self.latinSquare = self.latin_square
-            del self.latin_square
-        super(Block, self).comp()
-        return self
-
-    def compile_treatments(self):
-        '''Treatments are lists of lists of blocks to run conditionally. Remove
-        this variable and add RunIf objects to those blocks.'''
-        for i, treatment in enumerate(self.treatments):
-            for block in treatment:
-                block.run_if = RunIf(permutation = i)
-        del self.treatments
+        if not getattr(self, 'latin_square', False):
+            return
+        if not hasattr(self, 'groups'):
+            raise ValueError, '''In block {0}, latin_square is only valid if
+            contents are groups.'''.format(self.id_str)
+        num_conditions = len(self.groups[0]) if self.groups else 0
+        if num_conditions == 0:
+            raise ValueError, '''In block {0}, can't do a Latin Square without
+            groups, or with empty groups.'''.format(self.id_str)
+        for (i, group) in enumerate(self.groups):
+            if len(group) != num_conditions:
+                raise ValueError, '''In block {0}, can't do a Latin Square on
+                groups of uneven sizes: group {1} has {2} members, but group 0
+                has {3}.'''.format(self.id_str, i, len(group), num_conditions)
+        if len(self.groups) % num_conditions != 0:
+            raise ValueError, '''In block {0}, can't do a balanced Latin Square
+            with {1} groups of {2}; the number of groups should be a multiple of
+            the number of members in a group.'''.format(self.id_str,
+                len(self.groups), num_conditions)
+
+    def _latin_square_table(self):
+        '''Returns, for each version (condition number) modulo the number of
+        conditions, the index of the member chosen from each group.'''
+        num_conditions = len(self.groups[0])
+        return [[(i + version) % num_conditions for i in range(len(self.groups))]
+            for version in range(num_conditions)]
+
+    def _compile(self, compiler, run_if = None, skip = ()):
+        contents = ['pages', 'groups', 'items']
+        skip = list(skip) + contents + ['blocks', 'treatments']
+        compiled = super(Block, self)._compile(compiler, run_if, skip)
+        if hasattr(self, 'blocks'):
+            compiled['blocks'] = self._compile_blocks(compiler)
+        for attribute in contents:
+            if hasattr(self, attribute):
+                compiled[attribute] = compiler.contents(compiler.compile(content)
+                        for content in getattr(self, attribute))
+        if getattr(self, 'latin_square', False):
+            # so participants' browsers only look up their version's row
+            compiled['latinSquareTable'] = self._latin_square_table()
+        return compiled
+
+def _condition(content):
+    '''Returns the condition that a Page or Item is pseudorandomized by, the
+    way speriment.js looks it up: the Item's own condition, or else that of
+    its first Page, even if that Page has none. Returns None if there isn't
+    one.'''
+    if getattr(content, 'condition', None) is not None:
+        return content.condition
+    if isinstance(content, Item) and type(content.contents) == list:
+        return getattr(content.contents[0], 'condition', None) if content.contents else None
+    elif isinstance(content, Item):
+        return getattr(content.contents, 'condition', None)
+    return None
@@ -1,12 +1,27 @@
-import copy
+import copy, collections
 from resource import Resource
+from speriment.utils import build_context
+
+# stands for the value of an attribute that hasn't been set
+_unset = object()
+
+def as_list(contents):
+    '''Returns contents as a list if it's an iterator, such as a generator of
+    components made from the rows of a csv file, and unchanged otherwise.'''
+    return list(contents) if isinstance(contents, collections.Iterator) else contents
 
 class Component(object):
     '''This is the superclass of Option, Page, Block, and Experiment. You should
-    not instantiate this class.'''
+    not instantiate this class.
+
+    Each subclass declares the attributes it can have in __slots__, so that
+    components take up little memory when experiments have many of them. An
+    attribute that hasn't been set has no value at all, so hasattr tells
+    whether it was given.'''
+
+    __slots__ = ('id_str', 'run_if', 'resources', 'tags')
 
-    # class variable
-    _id_generator = None
+    _json_names = {'id_str': 'id', 'run_if': 'runIf'}
 
     def __init__(self):
         raise ValueError, 'Component is an abstract class that should not be instantiated.'
@@ -15,7 +30,7 @@ class Component(object):
         if id_str:
             self.id_str = id_str
         else:
-            self.id_str = self._id_generator._next_id()
+            self.id_str = build_context().id_generator._next_id()
 
     def new(self):
         '''Use this method to return a new experimental component with the same
@@ -24,7 +39,7 @@ class Component(object):
         they can coexist in an experiment and won't be confused with each other,
         for instance if one is referred to in a RunIf.'''
         new_component = copy.deepcopy(self)
-        new_component.id_str = self._id_generator._next_id()
+        new_component.id_str = build_context().id_generator._next_id()
         for att in ['blocks', 'items', 'pages', 'options']:
             if hasattr(new_component, att):
                 setattr(new_component, att, [item.new()
@@ -39,38 +54,68 @@ class Component(object):
 
     def _set_optional_args(self, **kwargs):
         for (key, value) in kwargs.iteritems():
+            if key not in self._field_names():
+                raise ValueError, '''{} is not a valid argument for {}.'''.format(key, type(self).__name__)
             setattr(self, key, value)
 
-    def validate_banks(self):
-        if hasattr(self, 'banks'):
-            for bank in self.banks:
-                types = [type(bank_item) for bank_item in bank]
-                if len(set(types)) > 1:
-                    raise ValueError, '''Bank must be homogeneous.'''
-                if len(bank) == 0:
-                    raise ValueError, '''Bank is empty.'''
-                elif type(bank[0]) == dict:
-                    first_keys = bank[0].keys
-                    bank_keys = [bank_item.keys for bank_item in bank]
-                    if set(bank_keys) != set(first_keys):
-                        raise ValueError, '''All items in bank must have the same fields.'''
+    @classmethod
+    def _field_names(cls):
+        '''Returns the names of the attributes declared by cls and its
+        superclasses.'''
+        if '_all_slots' not in cls.__dict__:
+            cls._all_slots = tuple(name for klass in reversed(cls.__mro__)
+                for name in klass.__dict__.get('__slots__', ()))
+        return cls._all_slots
+
+    def _fields(self):
+        '''Returns (name, value) for each attribute that has been set, including
+        any that aren't declared, in subclasses that allow them. Attributes
+        whose names start with an underscore aren't part of the experiment.'''
+        fields = [(name, getattr(self, name, _unset)) for name in self._field_names()]
+        fields = [(name, value) for (name, value) in fields if value is not _unset]
+        fields.extend((name, value) for (name, value) in getattr(self, '__dict__', {}).iteritems()
+            if not name.startswith('_'))
+        return fields
 
     def _validate(self):
         '''To be defined for each subtype.'''
         pass
 
-    def compile_resources(self):
+    def _compile(self, compiler, run_if = None, skip = ()):
+        '''Returns a dictionary representing this component in the JSON,
+        without modifying the component. run_if, if given, replaces any RunIf
+        the component has. skip names attributes to leave out.'''
+        skip = list(skip) + ['resources']
+        if run_if:
+            skip.append('run_if')
+        compiled = compiler.fields(self, skip)
+        if run_if:
+            compiled['runIf'] = compiler.compile(run_if)
         if hasattr(self, 'resources'):
-            for i, resource in enumerate(self.resources):
-                if type(resource) == str:
-                    self.resources[i] = Resource(resource)
-
-    def comp(self):
-        if hasattr(self, 'id_str'):
-            self.id = self.id_str
-            del self.id_str
-        if hasattr(self, 'run_if'):
-            self.runIf = self.run_if
-            del self.run_if
-        self.compile_resources()
-        return self
+            compiled['resources'] = self.compile_resources(compiler)
+        return compiled
+
+    def compile_resources(self, compiler):
+        '''Resources given as strings are compiled as Resources with default
+        settings.'''
+        return [compiler.compile(Resource(resource) if type(resource) == str else resource)
+                for resource in self.resources]
+
+    def _compile_blocks(self, compiler):
+        '''Treatments are lists of lists of blocks to run conditionally. They
+        are compiled as RunIf objects on those blocks rather than as an
+        attribute of their container.'''
+        return compiler.contents(compiler.compile(block, **kwargs)
+                for (block, kwargs) in self._block_arguments())
+
+    def _block_arguments(self):
+        '''Returns a list of (block, keyword arguments to compile it with) for
+        each of this component's blocks.'''
+        from run_if import RunIf # run_if imports utils, which imports this module
+        permutations = {}
+        for i, treatment in enumerate(getattr(self, 'treatments', [])):
+            for block in treatment:
+                permutations[id(block)] = i
+        return [(block, {'run_if': RunIf(permutation = permutations[id(block)])})
+                if id(block) in permutations else (block, {})
+                for block in self.blocks]
@@ -1,16 +1,23 @@
 from component import Component
-from sample_from import SampleFrom
-import pkg_resources, json, jsonschema, copy
-from speriment.compiler import ExperimentEncoder
-from speriment.utils import make_exp, make_task, IDGenerator
+import json, os
+from speriment.compiler import Compiler, write_json
+from speriment.schema import SchemaCheck
+from speriment.resources import bundle_resources
+from speriment.validation import Validation
+from speriment.utils import make_exp, make_task
 
 class Experiment(Component):
     '''An Experiment holds all the information describing one experiment. If you
     don't make your own IDs (IDs should be unique among pages, among options,
     and among blocks within one experiment), then use one IDGenerator per
     experiment.'''
+    _json_names = dict(Component._json_names, flush_trials = 'flushTrials',
+            flush_seconds = 'flushSeconds', compact_trials = 'compactTrials',
+            prefetch_pages = 'prefetchPages', prefetch_cache = 'prefetchCache')
+
     def __init__(self, blocks, exchangeable = [], counterbalance = [], banks =
-            {}, treatments = []):
+            {}, treatments = [], flush_trials = None, flush_seconds = None,
+            compact_trials = False, prefetch_pages = None, prefetch_cache = None):
         '''
         blocks: [Block], the contents of the experiment.
 
@@ -37,6 +44,31 @@ class Experiment(Component):
         should have the same keys. Bank information can be used for page text,
         option text, page feedback, option feedback, resource filenames, or page
         condition.
+
+        flush_trials: integer, optional. If given, participants' trial data is
+        sent to PsiTurk and saved every flush_trials trials, rather than all at
+        once at the end of the experiment, so that long sessions don't build
+        one huge save and participants who quit partway through keep what they
+        did. Use speriment-output's --partial option to include their data.
+
+        flush_seconds: number, optional. Like flush_trials, but saves any trial
+        data not yet saved every flush_seconds seconds. Can be used with
+        flush_trials.
+
+        compact_trials: boolean, optional. If True, participants' trial data
+        records only IDs, times, responses, and values sampled from banks,
+        leaving out texts, tags, and anything else that can be looked up in
+        the compiled experiment. This makes the data saved for each
+        participant much smaller. speriment-output fills the rest back in when
+        given the experiment's JavaScript file with --experiment.
+
+        prefetch_pages: integer, optional. While each page is displayed, the
+        images, audio, and video of the next prefetch_pages pages are loaded,
+        so that loading them doesn't delay the pages and their StartTimes.
+        Defaults to 3. 0 turns prefetching off.
+
+        prefetch_cache: integer, optional. The most resources that are kept
+        loaded ahead of time. Defaults to 20.
         '''
 
         self.blocks = [b for b in blocks]
@@ -48,70 +80,157 @@ class Experiment(Component):
             self.banks = banks
         if treatments:
             self.treatments = treatments
+        if flush_trials:
+            self.flush_trials = flush_trials
+        if flush_seconds:
+            self.flush_seconds = flush_seconds
+        if compact_trials:
+            self.compact_trials = compact_trials
+        if prefetch_pages is not None:
+            self.prefetch_pages = prefetch_pages
+        if prefetch_cache is not None:
+            self.prefetch_cache = prefetch_cache
+
+    def validate_banks(self):
+        '''Checks that each SampleFrom in the experiment has a bank to sample
+        from, that the bank has enough values for its SampleFroms to sample
+        different values where they should, that they all sample with or
+        without replacement, and that they give a field if and only if the
+        bank's values are dictionaries with that field. This is done before
+        the experiment is compiled.'''
+        self._sampler_index()
 
-    def _validate(self):
-        if hasattr(self, 'banks'):
-            self.validate_banks()
+    def _sampler_index(self):
+        '''Returns the SamplerIndex of the experiment's SampleFroms, once its
+        banks have been checked.'''
+        validation = Validation(self, banks_only = True)
+        if validation.errors:
+            raise ValueError, 'The banks of the experiment are not valid:\n\n' + \
+                '\n'.join(validation.errors)
+        return validation.samplers
 
-    def get_bank_samplers(self, samplers, bank):
-        return [sampler for sampler in samplers if sampler.bank == bank]
+    def _compiler(self, **kwargs):
+        '''Checks the experiment's banks and returns a Compiler for it, with
+        any keyword arguments to Compiler. SampleFroms without variables are
+        numbered after the variables of the SampleFroms in the experiment,
+        wherever the experiment was made.'''
+        return Compiler(self._sampler_index().sampler_generators(), **kwargs)
 
-    def validate_banks(self):
-        samplers = get_samplers(self)
-        for bank in self.banks:
-            bank_samplers = self.get_bank_samplers(samplers, bank)
-            any_replacement = True if any(s.with_replacement for s in samplers) else False
-            all_replacement = True if all(s.with_replacement for s in samplers) else False
-            num_samplers = len(samplers)
-            if num_samplers > len(bank) and not any_replacement:
-                raise ValueError('''{} does not have enough values to sample {} times without replacement.'''.format(bank_name, num_samplers))
-            if any_replacement and not all_replacement:
-                raise ValueError('''Some SampleFrom objects for bank {} are
-                    with replacement and some are without replacement. They
-                    must all sample the same way.'''.format(bank_name))
-            if any(type(val) == dict for val in bank):
-                if not all(type(val) == dict for val in bank):
-                    raise ValueError('''Values in {} must all be either strings or dictionaries'''.format(bank_name))
-                fields = bank[0].keys()
-                if not all(val.keys() == fields for val in bank):
-                    raise ValueError('''All values in {} must have the same fields'''.format(bank_name))
-                if not all(hasattr(sampler, field) for sampler in samplers):
-                    raise ValueError('''All SampleFrom objects sampling from {} must specify a field.'''.format(bank_name))
-                if not all(sampler.field in fields for sampler in samplers):
-                    for sampler in samplers:
-                        if sampler.field not in fields:
-                            raise ValueError('''Attempt to sample {} field from {}, which is not among its fields'''.format(sampler.field, bank_name))
-
-    def _validate_json(self, json_object):
-        contents = pkg_resources.resource_string(__name__, 'sperimentschema.json')
-        schema = json.loads(contents)
-        jsonschema.validate(json_object, schema)
+    def validate(self):
+        '''Checks the whole experiment without compiling it, faster than
+        compiling it would. As well as what compiling checks, this checks that
+        IDs are unique among Blocks, Items, Pages, and Options, that RunIfs
+        refer to Pages and Options in the experiment, and that exchangeable
+        and counterbalance refer to Blocks in the right container. Raises a
+        ValueError listing every problem found, with the JSON path of the
+        component it was found in.'''
+        Validation(self).finish()
+
+    def _validate_json(self, json_object, all_errors = False):
+        '''Validates json_object, the output of compile, against the schema.
+        If all_errors is True, every error is reported with its JSON path
+        instead of just the first.'''
+        check = SchemaCheck(all_errors)
+        check.check(json_object)
+        check.finish()
+
+    def _compile(self, compiler, bundle = None):
+        '''bundle, if given, is what bundle_resources returned for this
+        experiment.'''
+        compiled = compiler.fields(self, ['blocks', 'treatments'])
+        compiled['blocks'] = self._compile_blocks(compiler)
+        if bundle is not None:
+            (compiled['resourceFiles'], compiled['resourceBytes'], manifest) = bundle
+            if manifest:
+                compiled['resourceManifest'] = manifest
+        return compiled
+
+    def compile(self):
+        '''Validates the experiment and returns the dictionary that will be
+        written out as its JSON. The experiment itself is not modified.'''
+        return self._compiler().compile(self)
 
     def to_JSON(self):
-        SampleFrom._compile_time_generators = copy.deepcopy(SampleFrom._id_generators)
-        return json.dumps(self, indent = 4, cls = ExperimentEncoder)
+        return json.dumps(self.compile(), indent = 4)
 
-    def to_file(self, filename, varname):
+    def to_file(self, filename, varname, compact = False, all_errors = False,
+            cache_dir = None, workers = None, resource_dir = None, resource_url = None):
         '''validates the structure of the experiment and writes it as a JSON
-        object in a JavaScript file.'''
-        json_experiment = self.to_JSON()
-        self._validate_json(json_experiment)
-        to_write = 'var ' + varname + ' = ' + json_experiment
-        with open(filename, 'w') as f:
-            f.write(to_write)
-
-    def install(self, experiment_name):
+        object in a JavaScript file. The JSON is written out as it is compiled
+        and validated, so memory use doesn't grow with the size of the
+        experiment. If compact is True, the JSON is written without indentation
+        or line breaks. If all_errors is True, every schema error is reported
+        with its JSON path instead of just the first. The file is only
+        replaced once the whole experiment has been written.
+
+        If cache_dir is given, the compiled Items and Blocks are kept in that
+        directory, and those that haven't changed since the last time the
+        experiment was written are reused rather than compiled and validated
+        again.
+
+        If workers is greater than 1, the experiment's blocks are compiled and
+        validated in that many processes at once. The file written is the same
+        either way.
+
+        If resource_dir is given, the files of the experiment's resources,
+        including those in banks, are copied into it under names that include
+        a hash of their contents, and participants' browsers load them from
+        resource_url (which defaults to resource_dir) under those names, so
+        that the files can be served with long-lived cache headers. The
+        compiled experiment records each file's size, the total size of each
+        block's files under resourceBytes, and the sources each block may
+        display under resourceManifest. Missing files and files that
+        aren't images, audio, or video are reported as errors.'''
+        bundle = None
+        if resource_dir is not None:
+            if resource_url is None:
+                resource_url = resource_dir
+            bundle = bundle_resources(self, resource_dir, resource_url.rstrip('/') + '/')
+        cache = None
+        if cache_dir is not None:
+            from speriment.cache import SubtreeCache
+            cache = SubtreeCache(cache_dir)
+        partial_filename = filename + '.partial'
+        try:
+            with open(partial_filename, 'w') as f:
+                self._write(f, varname, compact, all_errors, cache, workers, bundle)
+        except:
+            os.remove(partial_filename)
+            raise
+        os.rename(partial_filename, filename)
+        if cache is not None:
+            cache.commit()
+
+    def _write(self, f, varname, compact = False, all_errors = False, cache = None,
+            workers = None, bundle = None):
+        '''Compiles, validates, and writes the experiment to the file object f
+        as to_file does, compiling through cache, a SubtreeCache, if given.
+        Raises a ValueError if it isn't valid, in which case what was written
+        to f should be thrown away.'''
+        compiler = self._compiler(lazy = True, cache = cache)
+        check = SchemaCheck(all_errors)
+        f.write('var ' + varname + ' = ')
+        indent = None if compact else 4
+        compiled = check.check(compiler.compile(self, bundle = bundle))
+        if workers > 1:
+            # multiprocessing is only imported when it's used
+            from speriment.parallel import compile_blocks
+            # replaces the lazily compiled blocks before they're used
+            compiled['blocks'] = compile_blocks(self, compiler, check, indent, workers, cache)
+        write_json(compiled, f, indent)
+        check.finish()
+
+    def install(self, experiment_name, compact = False, all_errors = False,
+            cache_dir = None, workers = None, bundle_resources = False):
         '''validates the structure of the experiment, writes it as a JSON object
         in a JavaScript file, and gives PsiTurk access to Speriment and the JSON
-        object.'''
+        object. See to_file for compact, all_errors, cache_dir, and workers. If
+        bundle_resources is True, the experiment's resource files are copied
+        into static/resources, as to_file does with resource_dir.'''
         filename = experiment_name + '.js'
         varname = experiment_name
-        self.to_file('./static/js/' + filename, varname)
+        resource_dir = 'static/resources' if bundle_resources else None
+        self.to_file('./static/js/' + filename, varname, compact, all_errors,
+                cache_dir, workers, resource_dir)
         make_exp(filename)
         make_task(varname)
-
-def get_samplers(obj):
-    attrs = obj.__dict__
-    samplers = [attr for attr in attrs if isinstance(attr, SampleFrom)]
-    children = [attr.__dict__ for attr in attrs if hasattr(attr, '__dict__') and not isinstance(attr, SampleFrom)]
-    return samplers + [get_samplers(child) for child in children]
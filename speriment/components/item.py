@@ -1,9 +1,11 @@
-from component import Component
+from component import Component, as_list
 from page import Page
 from run_if import RunIf
 from sample_from import SampleFrom
 
 class Item(Component):
+    __slots__ = ('contents', 'condition')
+
     def __init__(self, contents, id_str = None, condition = None, tags = None, run_if = None, **kwargs):
         '''
         contents: string, Page, or [Page]. Items contain one or more Pages and display
@@ -27,7 +29,7 @@ class Item(Component):
         condition is satisfied.
         '''
         self._set_id(id_str)
-        self.contents = contents
+        self.contents = as_list(contents)
         if condition != None:
             self.condition = condition
         if tags != None:
@@ -35,52 +37,50 @@ class Item(Component):
         if run_if != None:
             self.run_if = run_if
 
-    def comp(self):
-        self.compile_item()
-        self.compile_feedback()
-        super(Item, self).comp()
-        return self
-
     def _validate(self):
         if not type(self.contents) == str and \
             not (type(self.contents) == list and isinstance(self.contents[0], Page)) and \
             not isinstance(self.contents, Page):
                 raise ValueError, '''Item must have a string, Page, or list of Pages as its first argument.'''
 
+    def _compile(self, compiler, run_if = None, skip = ()):
+        compiled = super(Item, self)._compile(compiler, run_if, list(skip) + ['contents'])
+        compiled['pages'] = [compiler.compile(page, **kwargs)
+                for (page, kwargs) in self.compile_feedback(self.compile_item())]
+        return compiled
+
     def compile_item(self):
+        '''Returns the Pages this Item displays. If its contents are a string
+        or SampleFrom, a Page is made for them, with an ID based on the
+        Item's.'''
         if type(self.contents) == str or isinstance(self.contents, SampleFrom):
-            self.pages = [Page(self.contents)]
+            return [Page(self.contents, id_str = self.id_str + '_page')]
         elif type(self.contents) == list:
-            self.pages = self.contents
+            return self.contents
         else:
-            self.pages = [self.contents]
-        del self.contents
-        return self
+            return [self.contents]
 
-    def compile_feedback(self):
+    def compile_feedback(self, pages):
         '''Feedback is a string or Page to run either unconditionally after a Page,
-        or conditionally after an Option is chosen. Remove this variable and instantiate
-        the Page with a RunIf if needed.'''
+        or conditionally after an Option is chosen. Returns (Page, compile
+        arguments) pairs in which the feedback is compiled as its own Page,
+        with a RunIf if needed, rather than as an attribute of the Page or
+        Option it belongs to. Feedback Pages made from strings are given IDs
+        based on the Page (and Option) they belong to.'''
         new_pages = []
-        for (i, page) in enumerate(self.pages):
-            feedback_pages = []
+        for page in pages:
+            new_pages.append((page, {'skip': ['feedback']}))
             if hasattr(page, 'feedback'):
-                page_feedback = page.feedback if isinstance(page.feedback, Page) else Page(page.feedback)
-                feedback_pages.append(page_feedback)
-                del page.feedback
+                page_feedback = page.feedback if isinstance(page.feedback, Page) else \
+                        Page(page.feedback, id_str = page.id_str + '_feedback')
+                new_pages.append((page_feedback, {}))
             if hasattr(page, 'options'):
                 for option in page.options:
                     if hasattr(option, 'feedback'):
-                        option_feedback = None
                         run_if = RunIf(page = page, option = option)
                         if isinstance(option.feedback, Page):
-                            option_feedback = option.feedback
-                            option_feedback.run_if = run_if
+                            new_pages.append((option.feedback, {'run_if': run_if}))
                         else:
-                            option_feedback = Page(option.feedback, run_if = run_if)
-                        feedback_pages.append(option_feedback)
-                        del option.feedback
-            new_pages.append(page)
-            new_pages += feedback_pages
-        self.pages = new_pages
-        return self
+                            new_pages.append((Page(option.feedback, run_if = run_if,
+                                id_str = '{}_{}_feedback'.format(page.id_str, option.id_str)), {}))
+        return new_pages
@@ -1,6 +1,8 @@
 from component import Component
 
 class Option(Component):
+    __slots__ = ('text', 'feedback', 'correct')
+
     def __init__(self, text = None, id_str = None, **kwargs):
         '''
         text: string or [string]. If the Option is not a text box, this is the label for the Option
@@ -42,7 +44,3 @@ class Option(Component):
         if text != None:
             self.text = text
         self._set_optional_args(**kwargs)
-
-    def comp(self):
-        super(Option, self).comp()
-        return self
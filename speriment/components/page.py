@@ -1,8 +1,13 @@
-from component import Component
+from component import Component, as_list
 from option import Option
+from resource import Resource
+from sample_from import SampleFrom
 from speriment.utils import check_list
 
 class Page(Component):
+    __slots__ = ('text', 'options', 'feedback', 'correct', 'ordered', 'exclusive',
+            'freetext', 'keyboard', 'condition')
+
     def __init__(self, text, options = None, id_str = None, **kwargs):
         '''
         text: string or [string], the text to be displayed on the page. The
@@ -55,11 +60,17 @@ class Page(Component):
         self._set_id(id_str)
         self.text = text
         self._set_optional_args(**kwargs)
+        options = as_list(options)
         if options:
             self.options = options
 
     def _validate_resources(self):
-        pass # check for supported filetypes
+        # the types of files given as strings and Resources are checked as
+        # they're compiled
+        for resource in getattr(self, 'resources', []):
+            if not isinstance(resource, (basestring, Resource, SampleFrom)):
+                raise ValueError, '''Resources must be filenames, Resources, or
+                SampleFroms, not {}.'''.format(resource)
 
     def _validate_lists(self):
         check_list(self, 'options')
@@ -108,14 +119,17 @@ class Page(Component):
                     pages with two options.'''
 
     def _validate(self):
+        self._validate_lists()
         self._validate_resources()
         self._validate_freetext()
         self._validate_keyboard()
         self._validate_multiple_choice()
-        self._validate_lists()
 
-    def comp(self):
-        if hasattr(self, 'freetext') and not hasattr(self, 'options'):
-            self.options = [Option()]
-        super(Page, self).comp()
-        return self
+    def _compile(self, compiler, run_if = None, skip = ()):
+        compiled = super(Page, self)._compile(compiler, run_if, list(skip) + ['options'])
+        if hasattr(self, 'options'):
+            # feedback left out of a Page is left out of its Options too
+            compiled['options'] = [compiler.compile(option, skip = skip) for option in self.options]
+        elif hasattr(self, 'freetext'):
+            compiled['options'] = [compiler.compile(Option(id_str = self.id_str + '_text'))]
+        return compiled
@@ -1,4 +1,19 @@
+import os, urlparse
+
+# the media types speriment.js can display, by file extension
+MEDIA_TYPES = {'jpg': 'img', 'jpeg': 'img', 'png': 'img', 'pdf': 'img',
+        'gif': 'img', 'mp3': 'audio', 'wav': 'audio', 'ogg': 'audio',
+        'mp4': 'video', 'webm': 'video'}
+
+def infer_media_type(source):
+    '''Returns the media type of the file at source, a filename or URL, from
+    its extension, or None if it isn't one speriment.js can display.'''
+    extension = os.path.splitext(urlparse.urlparse(source).path)[1]
+    return MEDIA_TYPES.get(extension[1:].lower())
+
 class Resource:
+    _json_names = {'media_type': 'mediaType'}
+
     def __init__(self, source, media_type = None, autoplay = False, controls = True, required = False):
         self.source = source
         self.media_type = media_type
@@ -7,10 +22,11 @@ class Resource:
         self.required = required
 
     def _validate(self):
-        pass
+        # sources whose type can't be told from their extension, such as URLs
+        # without one, are left to speriment.js; only bundling needs to know
+        if self.media_type is not None and self.media_type not in set(MEDIA_TYPES.values()):
+            raise ValueError, '''Resource {} has media_type {}, but it must be
+            one of img, audio, and video.'''.format(self.source, self.media_type)
 
-    def comp(self):
-        if hasattr(self, 'media_type'):
-            self.mediaType = self.media_type
-            del self.media_type
-        return self
+    def _compile(self, compiler):
+        return compiler.fields(self)
@@ -44,15 +44,12 @@ class RunIf:
             if not (type(item_contents) != list or len(item_contents) == 1):
                 raise ValueError, '''Cannot set RunIf by Item if Item has more than one Page.'''
 
-    def comp(self):
+    def _compile(self, compiler):
+        compiled = compiler.fields(self, ['item', 'page', 'option'])
         if hasattr(self, 'page'):
-            self.pageID = self.page.id_str if self.page.id_str else self.page.id
-            del self.page
+            compiled['pageID'] = self.page.id_str
         if hasattr(self, 'option'):
-            self.optionID = self.option.id_str if self.option.id_str else self.option.id
-            del self.option
+            compiled['optionID'] = self.option.id_str
         if hasattr(self, 'item'):
-            page = self.item.pages[0]
-            self.pageID = page.id_str if page.id_str else page.id
-            del self.item
-        return self
+            compiled['pageID'] = self.item.compile_item()[0].id_str
+        return compiled
@@ -1,5 +1,4 @@
-from speriment.utils import IDGenerator, at_most_one
-import copy
+from speriment.utils import at_most_one, build_context
 
 class SampleFrom:
     '''Stands in place of a value of a Page or Option and tells the program to
@@ -7,9 +6,7 @@ class SampleFrom:
     sampled, the choice will remain in place for all iterations of the block.
     Sampling happens after pages are chosen from groups.'''
 
-    _id_generators = {} # {bankname: IDGenerator}
-    _variable_maps = {} # {bankname: {variablename: index}}
-    _compile_time_generators = {} # {bankname: IDGenerator}
+    _json_names = {'bank': 'sampleFrom', 'with_replacement': 'withReplacement'}
 
     def __init__(self, bank, variable = None, not_variable = None, field = None,
             with_replacement = False):
@@ -49,41 +46,37 @@ class SampleFrom:
         the same value.
         '''
         self.bank = bank
-        if bank not in SampleFrom._id_generators:
-            SampleFrom._id_generators[bank] = IDGenerator()
-            SampleFrom._variable_maps[bank] = {}
+        # the numbers the runtime uses in place of variable names, given out
+        # by the experiment this is made for
+        context = build_context()
         if variable != None:
             self.variable = variable
-            if not variable in SampleFrom._variable_maps[bank]:
-                SampleFrom._variable_maps[bank][variable] = SampleFrom._id_generators[bank]._next_id()
+            self._variable_index = int(context.variable_index(bank, variable))
         if not_variable != None:
             self.not_variable = not_variable
-            if not not_variable in SampleFrom._variable_maps[bank]:
-                SampleFrom._variable_maps[bank][not_variable] = SampleFrom._id_generators[bank]._next_id()
+            self._not_variable_index = int(context.variable_index(bank, not_variable))
         if with_replacement:
             self.with_replacement = with_replacement
         if field != None:
             self.field = field
 
-    def map_variables(self):
-        mapping = SampleFrom._variable_maps[self.bank]
+    def map_variables(self, compiler):
+        '''Returns the numbers the runtime uses in place of variable names. A
+        SampleFrom with no variable, not_variable, or with_replacement is given
+        a variable no other SampleFrom on its bank uses.'''
         if hasattr(self, 'variable'):
-            self.variable = int(mapping[self.variable])
+            return {'variable': self._variable_index}
         elif hasattr(self, 'not_variable'):
-            self.not_variable = int(mapping[self.not_variable])
+            return {'notVariable': self._not_variable_index}
+        elif not hasattr(self, 'with_replacement'):
+            return {'variable': int(compiler.sampler_generator(self.bank)._next_id())}
         else:
-            if not hasattr(self, 'with_replacement'):
-                self.variable = int(SampleFrom._compile_time_generators[self.bank]._next_id())
+            return {}
 
     def _validate(self):
         at_most_one(self, ['variable', 'not_variable', 'with_replacement'])
 
-    def comp(self):
-        self.map_variables()
-        if hasattr(self, 'bank'):
-           self.sampleFrom = self.bank
-           del self.bank
-        if hasattr(self, 'not_variable'):
-           self.notVariable = self.not_variable
-           del self.not_variable
-        return self
+    def _compile(self, compiler):
+        compiled = compiler.fields(self, ['variable', 'not_variable'])
+        compiled.update(self.map_variables(compiler))
+        return compiled
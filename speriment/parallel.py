@@ -0,0 +1,75 @@
+import multiprocessing
+from StringIO import StringIO
+from speriment.compiler import Compiler, RawJSON, write_json
+from speriment.schema import SchemaCheck
+from speriment.cache import SubtreeCache, Fingerprints
+from speriment.utils import IDGenerator
+
+__all__ = []
+
+# The experiment whose blocks a worker process compiles, set by _set_experiment
+# when the worker starts. Each pool gets its own, so compiling experiments in
+# several threads at once doesn't mix them up.
+_experiment = None
+
+_caches = {} # {cache directory: SubtreeCache}, one per worker process
+
+def compile_blocks(experiment, compiler, check, indent, workers, cache = None):
+    '''Compiles, validates, and serializes the blocks of experiment in a pool of
+    workers processes. Returns a generator of the blocks as RawJSON, in order,
+    for write_json to write at the level of an Experiment's blocks. Schema
+    errors found by the workers are added to check, and the entries they used
+    to cache.
+
+    Each block is compiled with the sampler counters it would have started
+    from if the blocks had been compiled one after another by compiler, so the
+    output is the same as compiling them serially.'''
+    fingerprints = Fingerprints() if cache is None else cache.fingerprints
+    counters = dict([(bank, generator._current())
+        for (bank, generator) in compiler.sampler_generators.iteritems()])
+    jobs = []
+    for (i, (block, kwargs)) in enumerate(experiment._block_arguments()):
+        jobs.append((i, kwargs, dict(counters), indent, check.all_errors,
+            None if cache is None else cache.directory))
+        for (bank, count) in fingerprints.get(block, compiler)[1].iteritems():
+            counters.setdefault(bank, IDGenerator()._current())
+            counters[bank] += count
+    for (bank, current) in counters.iteritems():
+        compiler.sampler_generator(bank).current_id = current
+    pool = multiprocessing.Pool(workers, _set_experiment, (experiment,))
+    try:
+        for (text, errors, used) in pool.imap(_compile_block, jobs):
+            check.errors.extend(errors)
+            if cache is not None:
+                cache.used |= used
+            yield RawJSON(text)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def _set_experiment(experiment):
+    '''Runs in each worker process as it starts, with the experiment its pool
+    compiles. Where processes are forked, the worker inherits the experiment;
+    elsewhere it receives a pickled copy.'''
+    global _experiment
+    _experiment = experiment
+
+def _compile_block(job):
+    '''Runs in a worker process. Returns the JSON text of one of _experiment's
+    blocks, the schema errors found in it, and the cache entries used.'''
+    (i, kwargs, counters, indent, all_errors, cache_dir) = job
+    cache = None
+    if cache_dir is not None:
+        if cache_dir not in _caches:
+            _caches[cache_dir] = SubtreeCache(cache_dir)
+        cache = _caches[cache_dir]
+        cache.used = set()
+    generators = dict([(bank, IDGenerator(current)) for (bank, current) in counters.iteritems()])
+    compiler = Compiler(generators, lazy = True, cache = cache)
+    check = SchemaCheck(all_errors)
+    f = StringIO()
+    compiled = compiler.compile(_experiment.blocks[i], **kwargs)
+    # blocks are at level 2: the experiment, then its list of blocks
+    write_json(check.check(compiled, 'block', '$.blocks[{}]'.format(i)), f, indent, 2)
+    return (f.getvalue(), check.errors, set() if cache is None else cache.used)
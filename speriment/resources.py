@@ -0,0 +1,137 @@
+import os, urlparse
+from speriment.components.page import Page
+from speriment.components.resource import Resource, infer_media_type
+from speriment.components.sample_from import SampleFrom
+
+__all__ = []
+
+def resource_manifest(experiment):
+    '''Returns {block ID: [source]}, the sources of the images, audio, and
+    video that may be displayed in each Block of experiment that displays any,
+    including everything that a SampleFrom standing in for a resource could
+    choose. A Block's sources include those of the Blocks inside it. Sources
+    are listed once each, in sorted order.'''
+    return _Manifest(experiment).blocks
+
+def bundle_resources(experiment, resource_dir, resource_url):
+    '''Copies the files of experiment's resources into resource_dir, naming
+    each copy after its file and a hash of its contents, so that browsers can
+    cache it for as long as they like and still never display a stale version.
+    Sources are paths relative to the current directory; those that are URLs
+    are left as they are.
+
+    Returns ({source: {'url': resource_url + the copy's name, 'mediaType':
+    string, 'bytes': integer}}, {block ID: total bytes of its sources},
+    {block ID: [source]}), the last as resource_manifest returns it.
+    Raises a ValueError naming every source that is missing or of a type
+    speriment.js can't display.'''
+    manifest = _Manifest(experiment)
+    files = {}
+    problems = []
+    for source in sorted(set(source for sources in manifest.blocks.itervalues() for source in sources)):
+        if urlparse.urlparse(source).netloc:
+            continue
+        media_type = manifest.media_types.get(source) or infer_media_type(source)
+        if not os.path.isfile(source):
+            problems.append('{} does not exist'.format(source))
+        elif media_type is None:
+            problems.append("{} isn't an image, audio, or video file".format(source))
+        else:
+            name = _copy(source, resource_dir)
+            files[source] = {'url': resource_url + name, 'mediaType': media_type,
+                    'bytes': os.path.getsize(source)}
+    if problems:
+        raise ValueError, '''Can't bundle the experiment's resources:
+        {}'''.format('\n        '.join(problems))
+    block_bytes = dict([(block_id, sum(files[source]['bytes'] for source in sources if source in files))
+        for (block_id, sources) in manifest.blocks.iteritems()])
+    return (files, block_bytes, manifest.blocks)
+
+def _copy(source, resource_dir):
+    '''Copies the file source into resource_dir, unless a copy is already
+    there, and returns the copy's name.'''
+    import hashlib, shutil # only needed when bundling
+    digest = hashlib.sha1()
+    with open(source, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    (stem, extension) = os.path.splitext(os.path.basename(source))
+    name = '{}.{}{}'.format(stem, digest.hexdigest()[:16], extension)
+    destination = os.path.join(resource_dir, name)
+    if not os.path.exists(destination):
+        if not os.path.isdir(resource_dir):
+            os.makedirs(resource_dir)
+        partial_destination = '{}.{}.partial'.format(destination, os.getpid())
+        shutil.copyfile(source, partial_destination)
+        os.rename(partial_destination, destination)
+    return name
+
+class _Manifest(object):
+    '''The sources of an experiment's resources, by Block.'''
+
+    def __init__(self, experiment):
+        self.blocks = {} # {block ID: [source]}
+        self.media_types = {} # {source: media type}, for Resources given one
+        for block in experiment.blocks:
+            self._add_block(block, getattr(experiment, 'banks', {}))
+
+    def _add_block(self, block, banks):
+        '''Adds block and the Blocks inside it. banks are those of the Blocks
+        and Experiment containing block. Returns block's sources.'''
+        banks = dict(banks)
+        banks.update(getattr(block, 'banks', {}))
+        sources = set()
+        for inner in getattr(block, 'blocks', []):
+            sources.update(self._add_block(inner, banks))
+        groups = getattr(block, 'groups', [])
+        contents = getattr(block, 'pages', []) + getattr(block, 'items', []) + \
+                [content for group in groups for content in group]
+        for content in contents:
+            for page in _pages(content):
+                sources.update(self._page_sources(page, banks))
+        if sources:
+            self.blocks[block.id_str] = sorted(sources)
+        return sources
+
+    def _page_sources(self, page, banks):
+        '''Returns the sources of page, its Options, and its feedback.'''
+        sources = set()
+        for resource in getattr(page, 'resources', []):
+            sources.update(self._sources(resource, banks))
+        feedback = [getattr(page, 'feedback', None)]
+        for option in getattr(page, 'options', []):
+            for resource in getattr(option, 'resources', []):
+                sources.update(self._sources(resource, banks))
+            feedback.append(getattr(option, 'feedback', None))
+        for feedback_page in feedback:
+            if isinstance(feedback_page, Page):
+                sources.update(self._page_sources(feedback_page, banks))
+        return sources
+
+    def _sources(self, resource, banks):
+        '''Returns the sources resource, a filename, Resource, or SampleFrom,
+        could have.'''
+        if isinstance(resource, basestring):
+            return [resource]
+        elif isinstance(resource, Resource):
+            sources = self._sources(resource.source, banks)
+            if resource.media_type is not None:
+                self.media_types.update((source, resource.media_type) for source in sources)
+            return sources
+        elif isinstance(resource, SampleFrom):
+            sources = []
+            for row in banks.get(resource.bank, []):
+                if hasattr(resource, 'field'):
+                    row = row.get(resource.field) if isinstance(row, dict) else None
+                sources.extend(self._sources(row, banks))
+            return sources
+        return []
+
+def _pages(content):
+    '''Returns the Pages a Page or Item displays, apart from feedback.'''
+    if isinstance(content, Page):
+        return [content]
+    pages = content.contents
+    if type(pages) == list:
+        return pages
+    return [pages] if isinstance(pages, Page) else []
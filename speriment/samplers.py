@@ -0,0 +1,137 @@
+from speriment.utils import IDGenerator
+
+__all__ = []
+
+class SamplerIndex(object):
+    '''The SampleFroms of an experiment, indexed by the bank each one samples
+    from, which is the nearest bank of its name in the Blocks containing it or
+    the Experiment. A Validation fills the index in as it walks the
+    experiment, calling enter on each component before the ones it contains
+    and add on each SampleFrom, and then every bank is checked against the
+    SampleFroms that use it without searching the experiment again.'''
+
+    def __init__(self):
+        self.banks = [] # [Bank], in the order they're found
+        self.unbound = [] # [(path, SampleFrom)] of SampleFroms with no bank
+        self.scope = {} # {bank name: Bank}, the banks of the Blocks and Experiment being walked
+        self.highest = {} # {bank name: the highest number given to a variable on it}
+        self.fresh = {} # {bank name: how many SampleFroms on it have been given fresh variables}
+
+    def enter(self, component, path):
+        '''Adds component's banks, if it has any, to the scope of the
+        components it contains. Returns the scope to restore once they've been
+        walked.'''
+        scope = self.scope
+        banks = getattr(component, 'banks', None)
+        if isinstance(banks, dict):
+            self.scope = dict(scope)
+            for (name, values) in sorted(banks.iteritems()):
+                self.scope[name] = Bank(name, values, '{}.banks.{}'.format(path, name))
+                self.banks.append(self.scope[name])
+        return scope
+
+    def add(self, sampler, path):
+        '''Indexes sampler, found at path, under the bank in scope it samples
+        from.'''
+        for name in ['_variable_index', '_not_variable_index']:
+            if hasattr(sampler, name):
+                self.highest[sampler.bank] = max(getattr(sampler, name),
+                        self.highest.get(sampler.bank, -1))
+        fresh = None
+        if not [name for name in ['variable', 'not_variable', 'with_replacement'] if hasattr(sampler, name)]:
+            # the compiler numbers these in the order the walk finds them
+            fresh = self.fresh.get(sampler.bank, 0)
+            self.fresh[sampler.bank] = fresh + 1
+        if sampler.bank in self.scope:
+            self.scope[sampler.bank].add(sampler, path, fresh)
+        else:
+            self.unbound.append((path, sampler))
+
+    def sampler_generators(self):
+        '''Returns {bank name: IDGenerator} of generators that continue on from
+        the variables of the SampleFroms on each bank, for a Compiler to give
+        fresh variables to the SampleFroms without one.'''
+        return dict([(bank, IDGenerator(highest)) for (bank, highest) in self.highest.iteritems()])
+
+    def problems(self):
+        '''Returns [(path, message)] for each problem with the experiment's
+        banks and the SampleFroms that use them.'''
+        problems = [(path, '''SampleFrom samples from bank {}, but there is no
+            bank of that name in the Experiment or the Blocks containing
+            it.'''.format(sampler.bank)) for (path, sampler) in self.unbound]
+        for bank in self.banks:
+            problems.extend(bank.problems(self.highest.get(bank.name, -1) + 1))
+        return problems
+
+class Bank(object):
+    '''A bank and the SampleFroms that sample from it, indexed by field and by
+    the way they sample.'''
+
+    def __init__(self, name, values, path):
+        self.name = name
+        self.values = values
+        self.path = path
+        self.fields = {} # {field, or None: [path]}
+        self.unnamed = [] # [path] of SampleFroms without replacement or variables
+        self.with_replacement = [] # [path]
+        self.highest = -1 # the highest number of a variable or not_variable
+        self.last_fresh = None # the last fresh variable, counted from the first
+
+    def add(self, sampler, path, fresh = None):
+        '''fresh: if sampler has neither a variable nor replacement, the
+        number of SampleFroms on banks of this name given fresh variables
+        before it.'''
+        for name in ['variable', 'not_variable']:
+            if hasattr(sampler, name):
+                self.highest = max(self.highest, getattr(sampler, '_{}_index'.format(name)))
+                break
+        else:
+            if getattr(sampler, 'with_replacement', False):
+                self.with_replacement.append(path)
+            else:
+                self.unnamed.append(path)
+                self.last_fresh = fresh
+        self.fields.setdefault(getattr(sampler, 'field', None), []).append(path)
+
+    def problems(self, start):
+        '''Returns [(path, message)] for each problem with the bank's values or
+        the way its SampleFroms use them. start is the number of the first
+        fresh variable on banks of this name.'''
+        if type(self.values) != list or len(self.values) == 0:
+            return [(self.path, 'Bank {} must be a non-empty list.'.format(self.name))]
+        problems = []
+        dicts = [type(value) == dict for value in self.values]
+        if any(dicts) and not all(dicts):
+            problems.append((self.path, '''Values in {} must all be either
+                strings or dictionaries.'''.format(self.name)))
+        elif all(dicts):
+            keys = set(self.values[0])
+            if any(set(value) != keys for value in self.values):
+                problems.append((self.path, '''All values in {} must have the
+                    same fields.'''.format(self.name)))
+            problems.extend((path, '''SampleFrom samples from {}, a bank of
+                dictionaries, so it must specify a field.'''.format(self.name))
+                for path in self.fields.get(None, []))
+            problems.extend((path, '''Attempt to sample {} field from {}, which
+                is not among its fields.'''.format(field, self.name))
+                for (field, paths) in self.fields.iteritems()
+                if field is not None and field not in keys for path in paths)
+        else:
+            problems.extend((path, '''SampleFrom samples field {} from {}, but
+                the values of {} aren't dictionaries.'''.format(field, self.name, self.name))
+                for (field, paths) in self.fields.iteritems()
+                if field is not None for path in paths)
+        # variables are numbered across every bank of this name, and each
+        # one is the position in the bank of the value it's given
+        needed = max(self.highest, -1 if self.last_fresh is None else start + self.last_fresh) + 1
+        if needed > len(self.values):
+            problems.append((self.path, '''{} has {} values, which is not enough
+                for its SampleFroms to sample {} different values without
+                replacement, as the variables of SampleFroms are numbered
+                across all the banks named {}.'''.format(self.name,
+                    len(self.values), needed, self.name)))
+        if self.with_replacement and self.unnamed:
+            problems.append((self.path, '''Some SampleFrom objects for bank {}
+                are with replacement and some are without replacement. They
+                must all sample the same way.'''.format(self.name)))
+        return problems
@@ -0,0 +1,92 @@
+import json, types, pkgutil
+from speriment.compiler import Precompiled
+
+__all__ = []
+
+# The schema definitions that the contents of Experiments and Blocks are
+# validated against when they're checked one at a time.
+CONTENT_DEFINITIONS = {'blocks': 'block', 'items': 'itemOrPage', 'pages': 'page', 'groups': 'group'}
+
+_schema = None
+_validators = {} # {definition name, or None for the whole schema: validator}
+
+def get_schema():
+    '''Returns the Speriment schema, reading it from the package the first time
+    it's needed.'''
+    global _schema
+    if _schema is None:
+        _schema = json.loads(pkgutil.get_data('speriment.components', 'sperimentschema.json'))
+    return _schema
+
+def get_validator(definition = None):
+    '''Returns a validator for the named definition in the Speriment schema, or
+    for the whole schema if definition is None. Each validator is built the
+    first time it's needed and reused by every experiment after that.'''
+    # jsonschema is slow to import, and many scripts never validate
+    import jsonschema
+    if not _validators:
+        jsonschema.Draft4Validator.check_schema(get_schema())
+    if definition not in _validators:
+        schema = get_schema()
+        if definition is not None:
+            # In draft 4, a schema with a $ref is replaced by what it refers
+            # to, which is looked up in the rest of the schema.
+            schema = dict(schema, **{'$ref': '#/definitions/' + definition})
+        _validators[definition] = jsonschema.Draft4Validator(schema)
+    return _validators[definition]
+
+def format_path(path, relative_path):
+    '''Returns a JSON path like $.blocks[0].items[2] made by adding
+    relative_path, a sequence of keys and indices, to path.'''
+    return path + ''.join(['[{}]'.format(part) if type(part) == int else '.' + part
+        for part in relative_path])
+
+class SchemaCheck(object):
+    '''Validates compiled experiments against the Speriment schema. If
+    all_errors is False, a ValueError is raised for the first error found.
+    Otherwise, errors are collected with their JSON paths, and finish raises a
+    ValueError listing all of them.'''
+
+    def __init__(self, all_errors = False):
+        self.all_errors = all_errors
+        self.errors = [] # [string]
+
+    def check(self, compiled, definition = None, path = '$'):
+        '''Validates compiled against the named schema definition, or the whole
+        schema if definition is None. compiled can come from a lazy Compiler,
+        in which case contents that haven't been compiled yet are validated one
+        at a time as they are compiled. Subtrees reused from a SubtreeCache are
+        not checked again. Returns a value to use in place of compiled so that
+        happens.'''
+        if isinstance(compiled, Precompiled) and compiled.validated:
+            return compiled
+        if not isinstance(compiled, dict):
+            self._validate(compiled, definition, path)
+            return compiled
+        lazy = [key for (key, value) in compiled.iteritems() if isinstance(value, types.GeneratorType)]
+        shell = dict(compiled)
+        for key in lazy:
+            shell[key] = []
+        self._validate(shell, definition, path)
+        for key in lazy:
+            shell[key] = self._check_each(compiled[key], CONTENT_DEFINITIONS[key], path + '.' + key)
+        return shell
+
+    def _check_each(self, contents, definition, path):
+        for (i, content) in enumerate(contents):
+            yield self.check(content, definition, '{}[{}]'.format(path, i))
+
+    def _validate(self, instance, definition, path):
+        import jsonschema
+        for error in get_validator(definition).iter_errors(instance):
+            # errors under oneOf list every alternative; report the closest
+            error = jsonschema.exceptions.best_match([error])
+            message = '{}: {}'.format(format_path(path, error.absolute_path), error.message)
+            if not self.all_errors:
+                raise ValueError, message
+            self.errors.append(message)
+
+    def finish(self):
+        '''Raises a ValueError listing all errors found, if any.'''
+        if self.errors:
+            raise ValueError, 'The experiment does not match the schema:\n\n' + '\n'.join(self.errors)
@@ -0,0 +1,244 @@
+import BaseHTTPServer, SocketServer, binascii, hmac, json, os, sys, threading, traceback, urllib2, urlparse
+from StringIO import StringIO
+from speriment.cache import SubtreeCache
+from speriment.compiler import write_json
+from speriment.schema import SchemaCheck, get_validator
+from speriment.components.experiment import Experiment
+
+__all__ = []
+
+DEFAULT_PORT = 8765
+
+# the most compiled Items and Blocks each cache directory keeps in memory
+KEPT_ENTRIES = 10000
+
+# the environment variable that serve and Client read the server's token from
+# when they aren't given one
+TOKEN_VARIABLE = 'SPERIMENT_SERVE_TOKEN'
+
+# the header each request sends the server's token in
+TOKEN_HEADER = 'X-Speriment-Token'
+
+# the names of this machine, which are the only hosts a request's Host and
+# Origin headers may name, so that web pages can't send requests by pointing
+# their own domain names at it
+LOCAL_HOSTS = frozenset(['localhost', '127.0.0.1', '::1'])
+
+class CompileService(object):
+    '''Compiles experiments into the JavaScript that to_file writes, keeping
+    everything it can warm between requests: the schema and its validators,
+    and a SubtreeCache for each cache directory it's asked to use, which
+    keeps the entries it has used most recently in memory. Nothing is written
+    to templates or static, as install does. Requests can be handled in
+    several threads at once; compilations through the same cache directory
+    take turns.'''
+
+    def __init__(self):
+        self.caches = {} # {cache directory: (SubtreeCache, Lock)}
+        self.lock = threading.Lock()
+        get_validator()
+
+    def compile_script(self, script, varname = 'experiment', compact = False,
+            all_errors = False, cache_dir = None):
+        '''script: string, the source of a Python script that makes an
+        Experiment, as one passed to install would, but without calling
+        install or to_file. The Experiment is the script's variable named
+        varname if it has one, and otherwise the only Experiment among its
+        variables. Relative filenames in the script are relative to the
+        directory the service was started in.
+
+        Returns the JavaScript assigning the compiled experiment to varname.
+        See to_file for compact, all_errors, and cache_dir.'''
+        namespace = {'__name__': '__speriment__'}
+        exec compile(script, '<script>', 'exec') in namespace
+        experiment = namespace.get(varname)
+        if not isinstance(experiment, Experiment):
+            experiments = [value for value in namespace.itervalues() if isinstance(value, Experiment)]
+            if len(experiments) != 1:
+                raise ValueError, '''The script must make exactly one Experiment, or
+                assign the one to compile to {}, but it made {}.'''.format(varname, len(experiments))
+            experiment = experiments[0]
+        return self.compile_experiment(experiment, varname, compact, all_errors, cache_dir)
+
+    def compile_experiment(self, experiment, varname = 'experiment', compact = False,
+            all_errors = False, cache_dir = None):
+        '''Returns the JavaScript assigning experiment, compiled, to varname.'''
+        f = StringIO()
+        if cache_dir is None:
+            experiment._write(f, varname, compact, all_errors)
+            return f.getvalue()
+        (cache, lock) = self._cache(cache_dir)
+        with lock:
+            cache.start()
+            experiment._write(f, varname, compact, all_errors, cache)
+            cache.commit()
+        return f.getvalue()
+
+    def compile_json(self, spec, varname = 'experiment', compact = False, all_errors = False):
+        '''spec: dictionary, an experiment already in its JSON form, as
+        compile returns. Returns the JavaScript assigning it to varname, once
+        it's been validated against the schema.'''
+        check = SchemaCheck(all_errors)
+        check.check(spec)
+        check.finish()
+        f = StringIO()
+        f.write('var ' + varname + ' = ')
+        write_json(spec, f, None if compact else 4)
+        return f.getvalue()
+
+    def _cache(self, cache_dir):
+        with self.lock:
+            if cache_dir not in self.caches:
+                self.caches[cache_dir] = (SubtreeCache(cache_dir, keep_entries = KEPT_ENTRIES), threading.Lock())
+            return self.caches[cache_dir]
+
+class LocalClient(object):
+    '''Stands in for a Client by calling a CompileService in this process, for
+    tests and scripts that want the same interface without a server.'''
+
+    def __init__(self, service = None):
+        self.service = service or CompileService()
+
+    def compile_script(self, script, **options):
+        '''Returns the compiled experiment that script makes. options are
+        those of CompileService.compile_script.'''
+        return self.service.compile_script(script, **options)
+
+    def compile_json(self, spec, **options):
+        '''Returns spec, validated, as JavaScript. options are those of
+        CompileService.compile_json.'''
+        return self.service.compile_json(spec, **options)
+
+class Client(object):
+    '''Sends experiments to a server started by serve or speriment-serve to be
+    compiled. Errors in the experiment or script are raised as ValueErrors.'''
+
+    def __init__(self, url = 'http://127.0.0.1:{}'.format(DEFAULT_PORT), token = None):
+        '''token: string, optional, the token the server printed when it
+        started. Defaults to the value of the environment variable
+        SPERIMENT_SERVE_TOKEN.'''
+        self.url = url.rstrip('/')
+        self.token = token or os.environ.get(TOKEN_VARIABLE, '')
+
+    def compile_script(self, script, **options):
+        '''Returns the compiled experiment that script makes. options are
+        those of CompileService.compile_script.'''
+        return self._request(dict(options, script = script))
+
+    def compile_json(self, spec, **options):
+        '''Returns spec, validated, as JavaScript. options are those of
+        CompileService.compile_json.'''
+        return self._request(dict(options, json = spec))
+
+    def _request(self, body):
+        request = urllib2.Request(self.url + '/compile', json.dumps(body),
+            {'Content-Type': 'application/json', TOKEN_HEADER: self.token})
+        try:
+            response = urllib2.urlopen(request)
+        except urllib2.HTTPError as e:
+            raise ValueError, json.load(e)['error']
+        return json.load(response)['output']
+
+class CompileServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''An HTTP server for a CompileService. Each request is a POST to /compile
+    of a JSON object with either script, the source of a script, or json, an
+    experiment already in its JSON form, along with any of varname, compact,
+    all_errors, and cache_dir. The response is a JSON object with output, the
+    compiled JavaScript, or with error, saying what went wrong.
+
+    Since scripts are run as the user who started the server, requests are
+    only served if they send the server's token in an X-Speriment-Token
+    header, are sent as application/json, and are addressed to this machine
+    rather than coming from a web page. cache_dir must be inside the
+    directory the server was started in.'''
+    daemon_threads = True
+
+    def __init__(self, address, service = None, token = None):
+        '''token: string, optional, the token requests must send. A random
+        one is made if it isn't given.'''
+        BaseHTTPServer.HTTPServer.__init__(self, address, _Handler)
+        self.service = service or CompileService()
+        self.token = token or binascii.hexlify(os.urandom(16))
+        # addresses that listen on every interface don't name this machine
+        self.hosts = LOCAL_HOSTS | (set([address[0].lower()]) - set(['', '0.0.0.0', '::']))
+        self.directory = os.path.realpath(os.getcwd())
+
+    def refusal(self, headers):
+        '''Returns (status, message) if a request with headers shouldn't be
+        served, and None if it should.'''
+        if not hmac.compare_digest(str(headers.getheader(TOKEN_HEADER, '')), self.token):
+            return (403, '''The request must send the token the server printed
+                when it started in its {} header.'''.format(TOKEN_HEADER))
+        if headers.getheader('Content-Type', '').split(';')[0].strip().lower() != 'application/json':
+            return (415, 'The request must be sent as application/json.')
+        if urlparse.urlparse('//' + headers.getheader('Host', '')).hostname not in self.hosts:
+            return (403, 'The request must be addressed to this machine.')
+        origin = headers.getheader('Origin')
+        if origin is not None and urlparse.urlparse(origin).hostname not in self.hosts:
+            return (403, 'The server does not take requests from web pages.')
+        return None
+
+    def cache_directory(self, cache_dir):
+        '''Returns the full path of cache_dir, as sent by a client, or raises
+        a ValueError if it isn't inside the directory the server was started
+        in, so that clients can't have files written anywhere else.'''
+        path = os.path.realpath(os.path.join(self.directory, cache_dir))
+        if path != self.directory and not path.startswith(os.path.join(self.directory, '')):
+            raise ValueError, '''cache_dir must be inside {}, the directory the
+                server was started in, but it is {}.'''.format(self.directory, path)
+        return path
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        if self.path != '/compile':
+            return self._respond(404, {'error': 'Requests go to /compile.'})
+        refusal = self.server.refusal(self.headers)
+        if refusal is not None:
+            (status, message) = refusal
+            return self._respond(status, {'error': ' '.join(message.split())})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.getheader('Content-Length', 0))))
+            options = dict([(str(key), body[key]) for key in
+                ['varname', 'compact', 'all_errors', 'cache_dir'] if key in body])
+            if 'cache_dir' in options:
+                options['cache_dir'] = self.server.cache_directory(options['cache_dir'])
+            if 'script' in body:
+                output = self.server.service.compile_script(body['script'], **options)
+            elif 'json' in body:
+                options.pop('cache_dir', None)
+                output = self.server.service.compile_json(body['json'], **options)
+            else:
+                return self._respond(400, {'error': 'The request needs a script or json.'})
+        except ValueError as e:
+            return self._respond(400, {'error': str(e)})
+        except Exception:
+            # most likely an error in the script, which its author will want
+            # to see in full
+            return self._respond(400, {'error': traceback.format_exc()})
+        self._respond(200, {'output': output})
+
+    def _respond(self, status, body):
+        text = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+def serve(host = '127.0.0.1', port = DEFAULT_PORT, token = None):
+    '''Compiles experiments sent by Clients until interrupted. Scripts sent to
+    the server are run with the permissions of the user who started it, so it
+    only listens on the local machine by default, and only serves requests
+    that send token. token defaults to the value of the environment variable
+    SPERIMENT_SERVE_TOKEN, or if that isn't set, a random token, which is
+    printed for Clients to use.'''
+    server = CompileServer((host, port), token = token or os.environ.get(TOKEN_VARIABLE))
+    print 'Serving on http://{}:{}/compile with token {}'.format(host, server.server_address[1], server.token)
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,224 @@
+import imp, json, os, sys
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('sqlalchemy')
+
+output = imp.load_source('speriment_output',
+        os.path.join(os.path.dirname(__file__), '..', '..', 'bin', 'speriment-output'))
+
+def trial(page, number, start, correct = None, iteration = 1):
+    '''The trialdata speriment.js saves for a page, as PsiTurk stores it.'''
+    data = {'PageID': page, 'TrialKey': '{}:{}'.format(page, iteration),
+            'BlockIDs': ['block'], 'Iteration': iteration, 'StartTime': start,
+            'EndTime': start + 100, 'SelectedPosition': [0]}
+    if correct is not None:
+        data['Correct'] = [correct]
+    return {'uniqueid': 'p:w', 'current_trial': number, 'trialdata': data}
+
+def participant(unique_id, trials):
+    return {'datastring': json.dumps({'data': [dict(t, uniqueid = unique_id) for t in trials]}),
+            'uniqueid': unique_id, 'cond': 0, 'counterbalance': 1, 'hitid': 'hit',
+            'workerid': unique_id.split(':')[1], 'codeversion': '1.0', 'endhit': None}
+
+def test_retrieve(tmpdir):
+    from datetime import datetime
+    from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, DateTime, Text
+    db_url = 'sqlite:///' + str(tmpdir.join('participants.db'))
+    metadata = MetaData()
+    table = Table('participants', metadata, Column('uniqueid', String, primary_key = True),
+        Column('workerid', String), Column('status', Integer), Column('endhit', DateTime),
+        Column('datastring', Text))
+    engine = create_engine(db_url)
+    metadata.create_all(engine)
+    rows = [('done', 1, 3, datetime(2020, 1, 1)), ('credited', 2, 5, datetime(2020, 1, 3)),
+        ('unrecorded', 3, 4, None), ('quit', 4, 2, None), ('excluded', 5, 3, datetime(2020, 1, 3))]
+    engine.execute(table.insert(), [{'uniqueid': unique_id, 'workerid': 'w{}'.format(worker),
+        'status': status, 'endhit': endhit} for (unique_id, worker, status, endhit) in rows])
+    def retrieved(**kwargs):
+        return sorted(row['uniqueid'] for row in output.retrieve(db_url, 'participants', ['w5'], 1, **kwargs))
+    assert retrieved() == ['credited', 'done', 'unrecorded']
+    assert retrieved(since = datetime(2020, 1, 2)) == ['credited', 'unrecorded']
+    assert retrieved(partial = True) == ['credited', 'done', 'quit', 'unrecorded']
+    assert retrieved(since = datetime(2020, 1, 2), partial = True) == ['credited', 'quit', 'unrecorded']
+
+def test_merge_saves():
+    first = {'TrialKey': 'a:1', 'TrialNumber': 0}
+    second = {'TrialKey': 'b:1', 'TrialNumber': 1}
+    again = {'TrialKey': 'a:1', 'TrialNumber': 2}
+    assert output.merge_saves([first, second, again]) == [second, again]
+    unkeyed = [{'TrialNumber': 0}, {'TrialNumber': 1}]
+    assert output.merge_saves(unkeyed) == unkeyed
+
+def test_new_trials():
+    saved = [dict(trial('a', 0, 0)['trialdata'], TrialNumber = 0),
+            dict(trial('b', 1, 10)['trialdata'], TrialNumber = 1),
+            # reloaded: a is saved again, then c is new
+            dict(trial('a', 2, 20)['trialdata'], TrialNumber = 2),
+            dict(trial('c', 3, 30)['trialdata'], TrialNumber = 3)]
+    assert [t['PageID'] for t in output.new_trials(saved)] == ['b', 'a', 'c']
+    assert [t['PageID'] for t in output.new_trials(saved, 1)] == ['c']
+    unkeyed = [dict((k, v) for (k, v) in t.iteritems() if k != 'TrialKey') for t in saved]
+    assert [t['TrialNumber'] for t in output.new_trials(unkeyed, 1)] == [2, 3]
+
+def test_state(tmpdir):
+    state_file = str(tmpdir.join('state'))
+    filename = str(tmpdir.join('out.csv'))
+    assert output.load_state(state_file, filename) == {'endhit': None, 'rows': 0, 'size': 0, 'written': {}}
+    with open(filename, 'w') as f:
+        f.write('rows')
+    with open(state_file, 'w') as f:
+        json.dump({'endhit': None, 'rows': 3, 'written': {'p:w': [0, 4, 2]}}, f)
+    state = output.load_state(state_file, filename)
+    assert state['written'] == {'p:w': 4}
+    output.save_state(state, state_file, filename)
+    assert output.load_state(state_file, filename) == dict(state, size = 4)
+    os.remove(filename)
+    assert output.load_state(state_file, filename)['rows'] == 0
+
+def test_participant_chunks():
+    lines = [json.dumps({'UniqueID': unique_id, 'n': n})
+            for (n, unique_id) in enumerate(['a', 'a', 'a', 'b', 'c', 'c'])]
+    chunks = list(output.participant_chunks(lines, 2))
+    assert [[t['n'] for t in chunk] for chunk in chunks] == [[0, 1, 2], [3, 4, 5]]
+
+def test_derive_columns():
+    data_frame = pd.DataFrame({
+        'UniqueID': ['a', 'a', 'a', 'b'],
+        'StartTime': [30, 10, 20, 5],
+        'BlockIDs': [['x'], ['x'], ['x'], ['x']],
+        'Iteration': [1, 1, 1, 1],
+        'Correct': [[True], [False], [True], None],
+        'SelectedPosition': [[1], [0], [2], []]})
+    names = ['ParticipantTrialIndex', 'IsCorrect', 'BlockAccuracy', 'CriterionProgress']
+    output.derive_columns(data_frame, names)
+    assert list(data_frame['ParticipantTrialIndex']) == [2, 0, 1, 0]
+    assert list(data_frame['IsCorrect'][:3]) == [True, False, True]
+    assert list(data_frame['BlockAccuracy'][:3]) == [2.0 / 3] * 3
+    assert list(data_frame['CriterionProgress']) == [2, 0, 1, 0]
+
+@pytest.mark.parametrize('arguments', [['-j'], ['-f', 'json'], ['-s', 'state', '--partial']])
+def test_derive_refused(monkeypatch, arguments):
+    monkeypatch.setattr(sys, 'argv', ['speriment-output', 'out'] + arguments + ['-d', 'IsCorrect'])
+    with pytest.raises(SystemExit):
+        output.parse()
+
+def run(participants, filename, state_file, output_format, jobs = 1, crash = False):
+    '''Does what speriment-output --since state_file does, with participants
+    standing in for the database. If crash is True, it stops before saving
+    the state.'''
+    state = output.load_state(state_file, filename)
+    rows = output.written_rows(state, filename, output_format, 2)
+    trials = output.track_written(output.format_data(output.track_endhit(participants, state),
+        jobs, None, state['written']), state)
+    if rows is not None:
+        trials = output.unwritten(trials, rows)
+    if output_format == 'json':
+        state['rows'] += output.write_json(trials, filename, state['rows'] > 0)
+    else:
+        state['rows'] = output.python_dataframe(trials, filename, 2, state['rows'])
+    if not crash:
+        output.save_state(state, state_file, filename)
+    return state
+
+@pytest.mark.parametrize('output_format', ['json', 'csv'])
+def test_since(tmpdir, output_format):
+    filename = str(tmpdir.join('out.' + output_format))
+    state_file = str(tmpdir.join('state'))
+    first = [trial('a', 0, 0, True), trial('b', 1, 10, False)]
+    other = participant('q:v', [trial('a', 0, 5, True)])
+    run([participant('p:w', first), other], filename, state_file, output_format)
+    # the participant reloads, saves b again, and goes on to c
+    later = first + [trial('b', 2, 20, True), trial('c', 3, 30)]
+    state = run([participant('p:w', later), other], filename, state_file, output_format)
+    assert state['written'] == {'p:w': 3, 'q:v': 0}
+    if output_format == 'json':
+        with open(filename) as f:
+            rows = json.load(f)
+    else:
+        rows = pd.read_csv(filename, index_col = 0).to_dict('records')
+    assert [(row['UniqueID'], row['PageID']) for row in rows] == \
+            [('p:w', 'a'), ('p:w', 'b'), ('q:v', 'a'), ('p:w', 'c')]
+    assert state['rows'] == 4
+
+@pytest.mark.parametrize('output_format', ['json', 'csv'])
+def test_since_after_crash(tmpdir, output_format):
+    filename = str(tmpdir.join('out.' + output_format))
+    state_file = str(tmpdir.join('state'))
+    first = participant('p:w', [trial('a', 0, 0), trial('b', 1, 10)])
+    run([first], filename, state_file, output_format)
+    # the next run writes its trials but stops before saving the state
+    later = participant('q:v', [trial('a', 0, 5)])
+    run([first, later], filename, state_file, output_format, crash = True)
+    state = run([first, later, participant('r:u', [trial('a', 0, 7)])],
+        filename, state_file, output_format)
+    if output_format == 'json':
+        with open(filename) as f:
+            rows = json.load(f)
+    else:
+        rows = pd.read_csv(filename, index_col = 0).to_dict('records')
+    assert [row['UniqueID'] for row in rows] == ['p:w', 'p:w', 'q:v', 'r:u']
+    assert state['rows'] == 4
+    assert output.written_rows(state, filename, output_format) is None
+
+def test_format_data_jobs():
+    participants = [participant('p{}:w'.format(n), [trial('a', 0, n), trial('b', 1, n + 1)])
+            for n in range(5)]
+    serial = list(output.format_data(participants))
+    assert list(output.format_data(participants, 2)) == serial
+    assert list(output.format_data(participants, 2, None, {'p0:w': 0, 'p1:w': 1})) == serial[1:2] + serial[4:]
+
+def test_rehydrate(tmpdir):
+    from speriment import make_experiment, IDGenerator, Experiment, Block, Item, Page, Option
+    with make_experiment(IDGenerator()):
+        page = Page('Pick one', options = [Option('yes', tags = {'kind': 'y'}), Option('no')],
+            tags = {'number': '1'})
+        item = Item(page)
+        block = Block(items = [item])
+        exp = Experiment([block], compact_trials = True)
+    filename = str(tmpdir.join('exp.js'))
+    exp.to_file(filename, 'exp')
+    pages = output.load_experiment(filename)
+    (yes, no) = [option.id_str for option in page.options]
+    compact = {'PageID': page.id_str, 'OptionOrder': [no, yes], 'SelectedID': [yes], 'Sampled': {}}
+    with pytest.raises(ValueError):
+        output.rehydrate(dict(compact), None)
+    output.rehydrate(compact, pages)
+    assert (compact['PageText'], compact['ItemID'], compact['BlockIDs']) == \
+            ('Pick one', item.id_str, [block.id_str])
+    assert compact['OptionTexts'] == ['no', 'yes']
+    assert compact['SelectedText'] == ['yes']
+    assert (compact['number'], compact['kind']) == ('1', ['NA', 'y'])
+    saved = {'PageID': page.id_str, 'OptionOrder': [yes, no], 'SelectedID': [no], 'Sampled': {}}
+    participants = [participant('p{}:w'.format(n), [{'current_trial': 0, 'trialdata': dict(saved)}])
+            for n in range(3)]
+    trials = list(output.format_data(participants, 2, pages))
+    assert [trial['SelectedText'] for trial in trials] == [['no']] * 3
+
+@pytest.mark.parametrize('output_format', ['parquet', 'feather'])
+def test_write_arrow(tmpdir, output_format):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    filename = str(tmpdir.join('out.' + output_format))
+    # written two participants at a time
+    trials = [dict(trial('a', 0, 0, True)['trialdata'], UniqueID = 'p{}:w'.format(n), TrialNumber = 0,
+            Version = 1, Permutation = '0', Condition = condition, PageResources = ['a.png'],
+            color = 'red', OptionTags = ['x', 'y'])
+        for (n, condition) in enumerate([1, True, None, 'c'])]
+    output.write_arrow(iter(trials), filename, output_format, 2, ['IsCorrect'])
+    if output_format == 'parquet':
+        table = pq.read_table(filename)
+    else:
+        table = pa.ipc.open_file(pa.memory_map(filename)).read_all()
+    rows = table.to_pydict()
+    assert rows['Condition'] == ['1', 'True', None, 'c']
+    assert rows['Permutation'] == [0] * 4
+    assert rows['ReactionTime'] == [100] * 4
+    assert rows['IsCorrect'] == [True] * 4
+    resource = rows['PageResources'][0][0]
+    if isinstance(resource, basestring):
+        # pyarrow can't write it as a struct
+        resource = json.loads(resource)
+    assert resource['source'] == 'a.png'
+    assert list(rows['color']) == ['red'] * 4
+    assert rows['OptionTags'][0] == ['x', 'y']
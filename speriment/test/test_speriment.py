@@ -1,5 +1,10 @@
 from speriment import *
-import json, pytest, copy
+import json, pytest, copy, sys, os, subprocess, time, urllib2
+from multiprocessing.pool import ThreadPool
+from speriment.server import LocalClient, Client, CompileServer
+from speriment.cache import SubtreeCache
+from speriment.resources import resource_manifest
+import threading
 
 def test_new():
     with make_experiment(IDGenerator()):
@@ -7,6 +12,15 @@ def test_new():
         o2 = o.new()
         assert o.id_str != o2.id_str
 
+def test_unset_attributes():
+    with make_experiment(IDGenerator()):
+        o = Option('a')
+        assert not hasattr(o, '__dict__')
+        assert not hasattr(o, 'correct')
+        assert dict(o._fields()) == {'id_str': o.id_str, 'text': 'a'}
+        o.correct = True
+        assert dict(o._fields())['correct'] == True
+
 def test_get_rows():
     answer = [['Col1', 'Col2'], ['one', 'two'], ['three', 'four']]
     rows = get_rows('speriment/test/tab_sep.csv', sep='\t')
@@ -21,6 +35,45 @@ def test_get_dicts():
     rows2 = get_dicts('speriment/test/comma_sep.csv')
     assert rows2 == answer
 
+def test_iter_dicts():
+    rows = iter_dicts('speriment/test/comma_sep.csv')
+    assert next(rows) == {'Col1': 'one', 'Col2': 'two'}
+    assert list(rows) == [{'Col1': 'three', 'Col2': 'four'}]
+    assert list(iter_rows('speriment/test/tab_sep.csv', sep='\t')) == get_rows('speriment/test/tab_sep.csv', sep='\t')
+
+def test_group_by_col():
+    rows = [['a', 1], ['b', 2], ['a', 3]]
+    groups = group_by_col(iter(rows), 0)
+    assert groups == {'a': [['a', 1], ['a', 3]], 'b': [['b', 2]]}
+    assert groups.keys() == ['a', 'b']
+
+def test_contents_from_generators():
+    with make_experiment(IDGenerator()):
+        rows = iter_dicts('speriment/test/comma_sep.csv')
+        block = Block(items = (Item(Page(row['Col1'], options = (Option(row['Col2']) for _ in range(2))))
+            for row in rows))
+        assert len(block.items) == 2
+        assert len(block.items[1].contents.options) == 2
+        exp = Experiment([block])
+        assert json.loads(exp.to_JSON())['blocks'][0]['items'][1]['pages'][0]['text'] == 'three'
+
+def test_items_from_frame():
+    frame = {'Question': ['q1', 'q2'], 'Option1': ['a', 'c'], 'Option2': ['b', 'd'],
+            'Condition': ['x', 'y'], 'Tag': ['1', '2']}
+    with make_experiment(IDGenerator()):
+        by_hand = [Item(Page(q, options = [Option(o1), Option(o2)], exclusive = False),
+                condition = c, tags = {'Tag': t}) for (q, o1, o2, c, t)
+            in zip(frame['Question'], frame['Option1'], frame['Option2'], frame['Condition'], frame['Tag'])]
+        expected = Experiment([Block(items = by_hand)]).to_JSON()
+    with make_experiment(IDGenerator()):
+        items = items_from_frame(frame, text = 'Question', options = ['Option1', 'Option2'],
+                condition = 'Condition', tags = ['Tag'], exclusive = False)
+        assert Experiment([Block(items = items)]).to_JSON() == expected
+        with pytest.raises(ValueError):
+            items_from_frame(frame, text = 'Question', exclsuive = False)
+    with pytest.raises(ValueError):
+        items_from_frame(frame, text = 'Question')
+
 def test_compile_treatments():
     with make_experiment(IDGenerator()):
         b1 = Block(pages = [])
@@ -102,6 +155,51 @@ def test_exactly_one():
             b3 = Block()
             b3._validate()
 
+def test_latin_square():
+    with make_experiment(IDGenerator()):
+        groups = [[Page('1a'), Page('1b')], [Page('2a'), Page('2b')],
+                [Page('3a'), Page('3b')], [Page('4a'), Page('4b')]]
+        b = Block(groups = groups, latin_square = True)
+        compiled = Experiment(blocks = [b, Block(groups = groups)]).compile()
+        assert compiled['blocks'][0]['latinSquareTable'] == [[0, 1, 0, 1], [1, 0, 1, 0]]
+        assert 'latinSquareTable' not in compiled['blocks'][1]
+        with pytest.raises(ValueError):
+            Block(groups = [[Page('1a'), Page('1b')], [Page('2a')]], latin_square = True)
+        with pytest.raises(ValueError):
+            Block(groups = groups[:3], latin_square = True)
+        with pytest.raises(ValueError):
+            Block(pages = [Page('a'), Page('b')], latin_square = True)
+
+def test_pseudorandom():
+    # the same cases are run through the runtime ordering in test/testBlock.js
+    with open('test/pseudorandom_cases.json') as f:
+        cases = json.load(f)
+    with make_experiment(IDGenerator()):
+        for case in cases:
+            pages = Block(pages = [Page('p', condition = c) for c in case['conditions']], pseudorandom = True)
+            items = Block(items = [Item(Page('p', condition = c)) for c in case['conditions']], pseudorandom = True)
+            for block in [pages, items]:
+                if case['feasible']:
+                    block._validate()
+                else:
+                    with pytest.raises(ValueError):
+                        block._validate()
+        with pytest.raises(ValueError):
+            Block(pages = [Page('p'), Page('q', condition = 'a')], pseudorandom = True)._validate()
+        # speriment.js takes an Item's condition from its first Page only
+        with pytest.raises(ValueError):
+            Block(items = [Item([Page('p'), Page('q', condition = 'a')]),
+                Item(Page('r', condition = 'b'))], pseudorandom = True)._validate()
+        with pytest.raises(ValueError):
+            Block(groups = [[Page('p', condition = 'a')]], pseudorandom = True)._validate()
+        # each version of this Latin Square displays two pages of one condition
+        groups = [[Page('1a', condition = 'a'), Page('1b', condition = 'b')],
+                [Page('2a', condition = 'b'), Page('2b', condition = 'a')]]
+        with pytest.raises(ValueError):
+            Block(groups = groups, latin_square = True, pseudorandom = True)._validate()
+        groups[1].reverse()
+        Block(groups = groups, latin_square = True, pseudorandom = True)._validate()
+
 def test_at_most_one():
     s = SampleFrom(bank = 'a', variable = 0, not_variable = 1)
     s2 = SampleFrom(bank = 'a', variable = 0)
@@ -139,9 +237,176 @@ def test_compile_resources():
         assert resources[2] == {u'source': u'elephants.mp4', u'mediaType': None, u'controls': True, u'autoplay': False, u'required': False}
         assert resources[3] == {u'sampleFrom': u'animals', u'variable': 0}
 
+def test_resource_types():
+    with make_experiment(IDGenerator()):
+        with pytest.raises(ValueError):
+            Experiment(blocks = [Block(pages = [Page('hi', resources = [
+                Resource('clip', media_type = 'movie')])])]).compile()
+        with pytest.raises(ValueError):
+            Page('hi', resources = [3])._validate()
+        # types that can't be inferred are only needed for bundling
+        Experiment(blocks = [Block(pages = [Page('hi', resources = ['http://example.com/a.JPG?size=2',
+            Resource('clip', media_type = 'video'), 'https://cdn.example.com/image', 'logo.svg'])])]).compile()
+
+def test_bundle_resources(tmpdir):
+    media = tmpdir.mkdir('media')
+    media.join('a.jpg').write('a' * 10)
+    media.join('b.wav').write('b' * 100)
+    (a, b) = (str(media.join('a.jpg')), str(media.join('b.wav')))
+    resource_dir = str(tmpdir.join('static', 'resources'))
+    filename = str(tmpdir.join('exp.js'))
+    def bundled():
+        exp.to_file(filename, 'exp', resource_dir = resource_dir, resource_url = 'static/resources')
+        with open(filename) as f:
+            return json.loads(f.read()[len('var exp = '):])
+    with make_experiment(IDGenerator()):
+        first = Block(pages = [Page('one', resources = [a, 'http://example.com/c.mp4'])])
+        second = Block(pages = [Page('two', resources = [SampleFrom('sounds')])],
+                banks = {'sounds': [a, b]})
+        exp = Experiment(blocks = [first, second])
+        compiled = bundled()
+        files = compiled['resourceFiles']
+        assert sorted(files) == [a, b]
+        assert files[b]['mediaType'] == 'audio'
+        assert files[b]['bytes'] == 100
+        copy = files[a]['url']
+        assert copy.startswith('static/resources/a.') and copy.endswith('.jpg')
+        assert tmpdir.join(copy).read() == 'a' * 10
+        assert compiled['resourceBytes'] == {first.id_str: 10, second.id_str: 110}
+        assert compiled['resourceManifest'] == {first.id_str: [a, 'http://example.com/c.mp4'],
+                second.id_str: [a, b]}
+        assert 'resourceManifest' not in exp.compile()
+        media.join('a.jpg').write('changed')
+        assert bundled()['resourceFiles'][a]['url'] != copy
+        media.join('b.wav').remove()
+        with pytest.raises(ValueError) as missing:
+            bundled()
+        assert b + ' does not exist' in str(missing.value)
+        notes = str(media.join('notes.txt'))
+        media.join('notes.txt').write('notes')
+        exp = Experiment(blocks = [Block(pages = [Page('three', resources = [notes])])])
+        exp.compile()
+        with pytest.raises(ValueError) as unknown:
+            bundled()
+        assert notes + " isn't an image, audio, or video file" in str(unknown.value)
+
 def test_block():
     pass
 
+def test_to_file(tmpdir):
+    with make_experiment(IDGenerator()):
+        pages = [Page('page {}'.format(n), options = [Option('a'), Option('b')]) for n in range(3)]
+        inner = Block(items = [Item([page], tags = {'n': str(n)}) for (n, page) in enumerate(pages)])
+        exp = Experiment(blocks = [Block(blocks = [inner, Block(pages = [])]), Block(groups = [pages])])
+        compiled_exp = exp.compile()
+        filename = str(tmpdir.join('exp.js'))
+        exp.to_file(filename, 'exp')
+        with open(filename) as f:
+            assert f.read() == 'var exp = ' + json.dumps(compiled_exp, indent = 4, separators = (',', ': '), sort_keys = True)
+        exp.to_file(filename, 'exp', compact = True)
+        with open(filename) as f:
+            assert f.read() == 'var exp = ' + json.dumps(compiled_exp, separators = (',', ':'), sort_keys = True)
+        assert tmpdir.listdir() == [tmpdir.join('exp.js')]
+
+def test_to_file_cache(tmpdir):
+    with make_experiment(IDGenerator()):
+        pages = [Page('page {}'.format(n), options = [Option('a', feedback = 'no')]) for n in range(3)]
+        first = Block(items = [Item([page]) for page in pages])
+        second = Block(pages = [Page(SampleFrom('words')), Page(SampleFrom('words'))],
+            banks = {'words': ['x', 'y']})
+        exp = Experiment(blocks = [Block(blocks = [first]), second])
+        cache_dir = str(tmpdir.join('cache'))
+        filename = str(tmpdir.join('exp.js'))
+        exp.to_file(filename, 'exp')
+        with open(filename) as f:
+            uncached = f.read()
+        for _ in range(2):
+            exp.to_file(filename, 'exp', cache_dir = cache_dir)
+            with open(filename) as f:
+                assert f.read() == uncached
+        pages[1].text = 'changed'
+        exp.to_file(filename, 'exp', cache_dir = cache_dir)
+        with open(filename) as f:
+            compiled = json.loads(f.read()[len('var exp = '):])
+        assert compiled == json.loads(exp.to_JSON())
+        assert compiled['blocks'][0]['blocks'][0]['items'][1]['pages'][0]['text'] == 'changed'
+        pages[1].ordered = 'not a boolean'
+        with pytest.raises(ValueError):
+            exp.to_file(filename, 'exp', cache_dir = cache_dir)
+        with pytest.raises(ValueError):
+            exp.to_file(filename, 'exp', cache_dir = cache_dir)
+
+def test_cache_keeps_recent_entries(tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    with make_experiment(IDGenerator()):
+        exp = Experiment(blocks = [Block(items = [Item(Page('page {}'.format(n))) for n in range(3)])])
+    exp.to_file(str(tmpdir.join('exp.js')), 'exp', cache_dir = cache_dir)
+    cache = SubtreeCache(cache_dir, keep_entries = 2)
+    keys = sorted(cache.committed)
+    for key in keys:
+        cache._read(key)
+    assert list(cache.entries) == keys[-2:]
+    cache._read(keys[-2])
+    assert list(cache.entries) == [keys[-1], keys[-2]]
+
+def test_to_file_workers(tmpdir):
+    with make_experiment(IDGenerator()):
+        blocks = [Block(pages = [Page(SampleFrom('words')), Page('{}'.format(n), options = [Option('a', feedback = 'no')])])
+            for n in range(5)]
+        exp = Experiment(blocks = blocks, treatments = [[blocks[1]], [blocks[3]]], banks = {'words': list('abcdefghij')})
+        filename = str(tmpdir.join('exp.js'))
+        exp.to_file(filename, 'exp')
+        with open(filename) as f:
+            serial = f.read()
+        exp.to_file(filename, 'exp', workers = 3)
+        with open(filename) as f:
+            assert f.read() == serial
+        # experiments compiled in other threads at the same time don't get mixed up
+        other = Experiment(blocks = [Block(pages = [Page('other')])])
+        def write(args):
+            (experiment, name) = args
+            experiment.to_file(str(tmpdir.join(name)), 'exp', workers = 2)
+            with open(str(tmpdir.join(name))) as f:
+                return f.read()
+        results = ThreadPool(4).map(write, [(exp, 'a.js'), (other, 'b.js'), (exp, 'c.js'), (other, 'd.js')])
+        assert results[0] == results[2] == serial
+        assert results[1] == results[3] != serial
+        blocks[2].pages[1].ordered = 'not a boolean'
+        with pytest.raises(ValueError) as e:
+            exp.to_file(filename, 'exp', workers = 3, all_errors = True)
+        assert '$.blocks[2].pages[1].ordered' in str(e.value)
+
+def test_compile_leaves_components_unchanged():
+    with make_experiment(IDGenerator()):
+        o = Option('a', feedback = 'a is correct')
+        p = Page('hello', options = [o], resources = ['cats.jpg'])
+        i = Item([p], run_if = RunIf(page = p, option = o))
+        b1 = Block(items = [i, Item('just text')])
+        b2 = Block(pages = [Page('second')])
+        exp = Experiment(blocks = [b1, b2], treatments = [[b1], [b2]])
+        before = [dict(c._fields()) for c in [o, p, i, b1, b2, exp]]
+        first = exp.to_JSON()
+        assert [dict(c._fields()) for c in [o, p, i, b1, b2, exp]] == before
+        assert exp.to_JSON() == first
+
+def test_experiment_treatments():
+    with make_experiment(IDGenerator()):
+        b1 = Block(pages = [])
+        b2 = Block(pages = [])
+        exp = Experiment(blocks = [b1, b2], treatments = [[b2], [b1]])
+        compiled_exp = exp.compile()
+        assert 'treatments' not in compiled_exp
+        assert compiled_exp['blocks'][0]['runIf'] == {'permutation': 1}
+        assert compiled_exp['blocks'][1]['runIf'] == {'permutation': 0}
+
+def test_run_if_item():
+    with make_experiment(IDGenerator()):
+        i1 = Item('question')
+        b = Block(items = [i1, Item('follow up', run_if = RunIf(item = i1, regex = 'yes'))])
+        compiled_exp = Experiment(blocks = [b]).compile()
+        ji1, ji2 = compiled_exp['blocks'][0]['items']
+        assert ji2['runIf'] == {'pageID': ji1['pages'][0]['id'], 'regex': 'yes'}
+
 def test_check_list():
     with make_experiment(IDGenerator()):
         p1 = Page('hi', options = Option('hi'))
@@ -154,6 +419,246 @@ def test_check_list():
 def test_option():
     pass
 
+def test_validate_json():
+    with make_experiment(IDGenerator()):
+        o = Option('a', feedback = 'a is correct', tags = {'animal': SampleFrom('animals')})
+        p = Page('hello', options = [o, Option('b')], resources = ['cats.jpg'], condition = 'c')
+        i = Item([p, Page('what?', freetext = True)], tags = {'kind': 'greeting'})
+        b1 = Block(items = [i, Item('follow up', run_if = RunIf(page = p, option = o))],
+                banks = {'animals': ['cat', 'dog']}, criterion = 1, cutoff = 3)
+        b2 = Block(groups = [[Page('one'), Page('two')], [Item('three'), Item('four')]], latin_square = True)
+        exp = Experiment(blocks = [b1, Block(blocks = [b2], exchangeable = [b2])])
+        exp._validate_json(exp.compile())
+
+def test_flush():
+    with make_experiment(IDGenerator()):
+        b = Block(pages = [Page('one')])
+        exp = Experiment(blocks = [b], flush_trials = 20, flush_seconds = 30)
+        compiled = exp.compile()
+        exp._validate_json(compiled)
+        assert (compiled['flushTrials'], compiled['flushSeconds']) == (20, 30)
+        assert 'flushTrials' not in Experiment(blocks = [b]).compile()
+        with pytest.raises(ValueError):
+            exp._validate_json(Experiment(blocks = [b], flush_trials = -1).compile())
+
+def test_compact_trials():
+    with make_experiment(IDGenerator()):
+        b = Block(pages = [Page('one')])
+        exp = Experiment(blocks = [b], compact_trials = True)
+        compiled = exp.compile()
+        exp._validate_json(compiled)
+        assert compiled['compactTrials'] == True
+        assert 'compactTrials' not in Experiment(blocks = [b]).compile()
+
+def test_resource_manifest():
+    with make_experiment(IDGenerator()):
+        pictures = Block(pages = [
+            Page('one', resources = ['a.jpg', Resource('b.mp3')], options = [
+                Option('yes', resources = ['c.png'], feedback = Page('right', resources = ['d.jpg']))]),
+            Page('two', resources = [SampleFrom('sounds', field = 'file')])],
+            banks = {'sounds': [{'file': 'e.wav'}, {'file': 'f.wav'}]})
+        text = Block(pages = [Page('three')])
+        outer = Block(blocks = [pictures, text])
+        last = Block(items = [Item([Page('four', resources = [SampleFrom('images')])])])
+        exp = Experiment(blocks = [outer, last], banks = {'images': ['g.jpg', 'a.jpg']})
+        manifest = resource_manifest(exp)
+        assert manifest[pictures.id_str] == ['a.jpg', 'b.mp3', 'c.png', 'd.jpg', 'e.wav', 'f.wav']
+        assert manifest[outer.id_str] == manifest[pictures.id_str]
+        assert manifest[last.id_str] == ['a.jpg', 'g.jpg']
+        assert text.id_str not in manifest
+        assert resource_manifest(Experiment(blocks = [text])) == {}
+
+def test_validate():
+    with make_experiment(IDGenerator()):
+        first = Page('first', options = [Option('yes'), Option('no')], id_str = 'same')
+        second = Page('second', id_str = 'same')
+        elsewhere = Page('not in the experiment')
+        b1 = Block(items = [Item(first), Item(Page('third', run_if = RunIf(page = elsewhere)))])
+        b2 = Block(pages = [second, Page('fourth', run_if = RunIf(page = first, option = Option('maybe')))])
+        outer = Block(blocks = [b1, b2], exchangeable = [b1, Block(pages = [Page('fifth')])])
+        Experiment(blocks = [Block(items = [Item(first)])]).validate()
+        with pytest.raises(ValueError) as errors:
+            Experiment(blocks = [outer]).validate()
+        message = str(errors.value)
+        assert '$.blocks[0].blocks[1].pages[0]: Page ID same is already used at $.blocks[0].blocks[0].items[0].pages[0]' in message
+        assert '$.blocks[0].blocks[0].items[1].pages[0].runIf: RunIf refers to Page' in message
+        assert '$.blocks[0].blocks[1].pages[1].runIf: RunIf refers to Option' in message
+        assert '$.blocks[0].exchangeable' in message
+
+def test_validate_banks():
+    with make_experiment(IDGenerator()):
+        inner = Block(pages = [Page(SampleFrom('words')), Page(SampleFrom('words')),
+            Page('person', tags = {'name': SampleFrom('people', field = 'name')})],
+            banks = {'words': ['a', 'b', 'c', 'd'], 'people': [{'name': 'x'}, {'name': 'y'}]})
+        named = Block(pages = [Page(SampleFrom('words', variable = 1)),
+            Page(SampleFrom('words', variable = 2)), Page(SampleFrom('words', variable = 1))])
+        outer = Block(blocks = [inner, named])
+        Experiment(blocks = [outer], banks = {'words': ['c', 'd']}).validate_banks()
+        with pytest.raises(ValueError) as errors:
+            Experiment(blocks = [outer, Block(pages = [Page(SampleFrom('missing'))]),
+                Block(pages = [Page('person', tags = {'age': SampleFrom('people', field = 'age')})],
+                    banks = {'people': [{'name': 'z'}]})], banks = {'words': ['c']}).validate_banks()
+        message = str(errors.value)
+        assert '$.banks.words: words has 1 values' in message
+        assert '$.blocks[2].pages[0].tags.age: Attempt to sample age field' in message
+        assert '$.blocks[1].pages[0].text: SampleFrom samples from bank missing' in message
+        assert '$.blocks[0].blocks[0].banks.words' not in message
+        with pytest.raises(ValueError):
+            Experiment(blocks = [named], banks = {'words': ['c']}).compile()
+
+def test_bank_capacity():
+    with make_experiment(IDGenerator()):
+        blocks = [Block(pages = [Page(SampleFrom('words')), Page(SampleFrom('words'))],
+            banks = {'words': ['a', 'b']}) for _ in range(2)]
+        with pytest.raises(ValueError) as errors:
+            Experiment(blocks = blocks).validate_banks()
+        message = str(errors.value)
+        # the second block's SampleFroms are compiled to variables 2 and 3
+        assert '$.blocks[1].banks.words: words has 2 values' in message
+        assert '$.blocks[0].banks.words' not in message
+        with pytest.raises(ValueError):
+            Experiment(blocks = blocks).validate()
+        named = Block(pages = [Page(SampleFrom('words', variable = 'x')),
+            Page(SampleFrom('words', variable = 'y'))], banks = {'words': ['a', 'b']})
+        Experiment(blocks = [named]).validate_banks()
+        # y is variable 1 wherever it's used
+        with pytest.raises(ValueError):
+            Experiment(blocks = [named, Block(pages = [Page(SampleFrom('words', variable = 'y'))],
+                banks = {'words': ['c']})]).validate_banks()
+
+def build_variant(n):
+    with make_experiment(IDGenerator()):
+        pages = [Page('{} {}'.format(n, i), options = [Option('a'), Option('b')],
+            tags = {'word': SampleFrom('words', variable = i % 3), 'other': SampleFrom('words')})
+            for i in range(n % 5 + 2)]
+        block = Block(items = [Item(page) for page in pages],
+            run_if = RunIf(page = pages[0], option = pages[0].options[1]))
+        exp = Experiment(blocks = [block], banks = {'words': [str(i) for i in range(10)]})
+    return exp.to_JSON()
+
+def test_build_in_threads():
+    variants = range(200)
+    serial = [build_variant(n) for n in variants]
+    interval = sys.getcheckinterval()
+    sys.setcheckinterval(1) # switch threads as often as possible
+    try:
+        pool = ThreadPool(16)
+        threaded = pool.map(build_variant, variants)
+        pool.close()
+    finally:
+        sys.setcheckinterval(interval)
+    assert threaded == serial
+    compiled = json.loads(serial[0])
+    assert compiled['blocks'][0]['items'][0]['pages'][0]['id'] == '2'
+    assert compiled['blocks'][0]['items'][1]['pages'][0]['tags']['word']['variable'] == 1
+    with make_experiment(IDGenerator()) as build:
+        with make_experiment(IDGenerator(100)):
+            Page('inner')
+        assert Page('outer').id_str == '0'
+        assert build.variable_index('words', 'x') == '0'
+
+def test_experiment_made_after_with():
+    with make_experiment(IDGenerator()):
+        block = Block(pages = [Page(SampleFrom('words', variable = 'x')), Page(SampleFrom('words'))],
+            banks = {'words': ['a', 'b']})
+    compiled = Experiment(blocks = [block]).compile()
+    assert [page['text']['variable'] for page in compiled['blocks'][0]['pages']] == [0, 1]
+
+SCRIPT = """
+from speriment import *
+with make_experiment(IDGenerator()):
+    pages = [Page('page {}'.format(n), options = [Option('a'), Option('b')]) for n in range(3)]
+    exp = Experiment(blocks = [Block(items = [Item(page) for page in pages])])
+"""
+
+def test_compile_service(tmpdir):
+    client = LocalClient()
+    filename = str(tmpdir.join('exp.js'))
+    namespace = {}
+    exec SCRIPT in namespace
+    namespace['exp'].to_file(filename, 'exp')
+    with open(filename) as f:
+        expected = f.read()
+    cache_dir = str(tmpdir.join('cache'))
+    for _ in range(2):
+        assert client.compile_script(SCRIPT, varname = 'exp', cache_dir = cache_dir) == expected
+    assert client.service.caches[cache_dir][0].entries
+    compiled = json.loads(expected[len('var exp = '):])
+    assert client.compile_json(compiled, varname = 'exp') == expected
+    with pytest.raises(ValueError):
+        client.compile_script(SCRIPT.replace("Option('b')]", "Option('b')], exclusive = 'no'"))
+    with pytest.raises(ValueError):
+        client.compile_script('from speriment import *')
+
+def test_compile_server():
+    server = CompileServer(('127.0.0.1', 0))
+    thread = threading.Thread(target = server.serve_forever)
+    thread.start()
+    try:
+        url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+        client = Client(url, server.token)
+        assert client.compile_script(SCRIPT, compact = True) == LocalClient().compile_script(SCRIPT, compact = True)
+        with pytest.raises(ValueError) as error:
+            client.compile_script(SCRIPT + 'undefined_name')
+        assert 'NameError' in str(error.value)
+        with pytest.raises(ValueError) as error:
+            client.compile_script(SCRIPT, cache_dir = '/tmp')
+        assert 'cache_dir must be inside' in str(error.value)
+        with pytest.raises(ValueError):
+            Client(url, 'wrong').compile_script(SCRIPT)
+        headers = {'Content-Type': 'application/json', 'X-Speriment-Token': server.token}
+        refused = [dict(headers, **{'Content-Type': 'text/plain'}),
+            dict(headers, Host = 'attacker.example:{}'.format(server.server_address[1])),
+            dict(headers, Origin = 'http://attacker.example')]
+        for request_headers in refused:
+            request = urllib2.Request(url + '/compile', json.dumps({'script': SCRIPT}), request_headers)
+            with pytest.raises(urllib2.HTTPError) as error:
+                urllib2.urlopen(request)
+            assert error.value.code in [403, 415]
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+# the most import speriment may take over starting Python, in seconds; it
+# took about 0.02 once validation, caching, and bundling were imported lazily
+IMPORT_TIME_LIMIT = 0.25
+
+def test_import_time():
+    import speriment
+    env = dict(os.environ, PYTHONPATH = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(speriment.__file__))] +
+        filter(None, [os.environ.get('PYTHONPATH')])))
+    heavy = subprocess.check_output([sys.executable, '-c', """import sys, speriment
+print [m for m in ['jsonschema', 'pkg_resources', 'multiprocessing'] if m in sys.modules]"""], env = env)
+    assert heavy.strip() == '[]'
+    def best_time(code):
+        times = []
+        for _ in range(3):
+            start = time.time()
+            subprocess.check_call([sys.executable, '-c', code], env = env)
+            times.append(time.time() - start)
+        return min(times)
+    assert best_time('import speriment') - best_time('pass') < IMPORT_TIME_LIMIT
+
+def test_schema_errors(tmpdir):
+    with make_experiment(IDGenerator()):
+        with pytest.raises(ValueError):
+            Page('misspelled', exclsuive = False)
+        b1 = Block(pages = [Page('fine'), Page('not boolean', exclusive = 'no')])
+        b2 = Block(items = [Item(Page('not boolean', ordered = 'yes'))])
+        exp = Experiment(blocks = [b1, b2])
+        filename = str(tmpdir.join('exp.js'))
+        with pytest.raises(ValueError) as fast:
+            exp.to_file(filename, 'exp')
+        assert '$.blocks[0].pages[1]' in str(fast.value)
+        assert '$.blocks[1]' not in str(fast.value)
+        with pytest.raises(ValueError) as every:
+            exp.to_file(filename, 'exp', all_errors = True)
+        assert '$.blocks[0].pages[1].exclusive' in str(every.value)
+        assert '$.blocks[1].items[0].pages[0].ordered' in str(every.value)
+        assert tmpdir.listdir() == []
+
 def test_sample_from():
     # SampleFrom can be: page text, page feedback text, option text, page resource source, option resource source, page tag, option tag, page correct, item condition
     pass
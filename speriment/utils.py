@@ -1,7 +1,8 @@
-import csv, itertools
-from components.component import Component
+import csv, threading
+from collections import OrderedDict
 
-__all__ = ['get_rows', 'get_dicts', 'group_by_col', 'IDGenerator', 'make_experiment']
+__all__ = ['get_rows', 'get_dicts', 'iter_rows', 'iter_dicts', 'group_by_col',
+        'items_from_frame', 'IDGenerator', 'make_experiment']
 
 def get_rows(csvfile, sep = ','):
     '''csvfile: string, a filename of a csv file.
@@ -11,10 +12,7 @@ def get_rows(csvfile, sep = ','):
 
     Returns: lists (one for each row in the file) of lists (one for each cell in
     the row) of strings.'''
-
-    with open(csvfile, 'r') as f:
-        rows = csv.reader(f, delimiter = sep)
-        return list(rows)
+    return list(iter_rows(csvfile, sep))
 
 def get_dicts(csvfile, sep = ','):
     '''csvfile: string, a filename of a csv file. The file should have a header
@@ -25,22 +23,112 @@ def get_dicts(csvfile, sep = ','):
 
     Returns: lists (one for each row in the file) of dictionaries mapping
     strings (column names) to strings (cell values).'''
+    return list(iter_dicts(csvfile, sep))
+
+def iter_rows(csvfile, sep = ','):
+    '''Like get_rows, but returns a generator that reads the file one row at a
+    time, so the whole file is never in memory. It can be passed anywhere a
+    list of rows can, including to Blocks, Pages, and Items as a generator of
+    the components made from each row.'''
+    with open(csvfile, 'r') as f:
+        for row in csv.reader(f, delimiter = sep):
+            yield row
 
+def iter_dicts(csvfile, sep = ','):
+    '''Like get_dicts, but returns a generator that reads the file one row at a
+    time. See iter_rows.'''
     with open(csvfile, 'r') as f:
-        dicts = csv.DictReader(f, delimiter = sep)
-        return list(dicts)
+        for row in csv.DictReader(f, delimiter = sep):
+            yield row
 
 def group_by_col(rows, column):
     '''rows: [[string]] (output of get_rows) or [{string: string}] (output of
-    get_dicts).
+    get_dicts), or a generator of either (output of iter_rows or iter_dicts).
+    The rows don't need to be sorted.
 
     column: integer if [[string]], string if [{string: string}].
 
     Returns: {column: rows}, a dictionary whose keys are the unique values in
-    the column provided, where each column value maps to a list of all rows with
-    that value.'''
-    return dict([(key, list(val)) for (key, val)
-        in itertools.groupby(rows, lambda r: r[column])])
+    the column provided, in the order they first appear, where each column
+    value maps to a list of all rows with that value.'''
+    groups = OrderedDict()
+    for row in rows:
+        groups.setdefault(row[column], []).append(row)
+    return groups
+
+def items_from_frame(frame, text, options = [], condition = None, tags = [], **kwargs):
+    '''Makes one Item per row of a table, each holding a Page with an Option
+    for each of the options columns. This is much faster than making each
+    component by hand when there are many rows. It must be used inside a with
+    make_experiment block, and gives the components the same IDs they would
+    get if made by hand with Options made before their Page and Pages before
+    their Item.
+
+    frame: a pandas DataFrame, or a dictionary mapping column names to lists
+    of equal length.
+
+    text: string, the name of the column holding the text of each Page.
+
+    options: [string], optional, the names of the columns holding the text of
+    each Option, in the order the Options should be given to their Page.
+
+    condition: string, optional, the name of the column holding each Item's
+    condition.
+
+    tags: [string], optional, the names of columns to tag each Item with. The
+    column names are used as the tag names.
+
+    **kwargs: optional keyword arguments given to every Page, as when making a
+    Page, such as exclusive = False.
+
+    Returns: [Item], in the order of the rows.'''
+    from components.option import Option # these import this module
+    from components.page import Page
+    from components.item import Item
+    for key in kwargs:
+        if key not in Page._field_names():
+            raise ValueError, '''{} is not a valid argument for Page.'''.format(key)
+    id_generator = build_context().id_generator
+    if id_generator is None:
+        raise ValueError, '''items_from_frame must be used inside a with
+        make_experiment block, which supplies the IDs.'''
+    texts = _column(frame, text)
+    option_texts = [_column(frame, column) for column in options]
+    conditions = _column(frame, condition) if condition is not None else None
+    tag_values = [_column(frame, column) for column in tags]
+    # IDs for each row's Options, Page, and Item, in that order
+    stride = len(options) + 2
+    ids = id_generator._next_ids(len(texts) * stride)
+    items = []
+    for (row, page_text) in enumerate(texts):
+        first_id = row * stride
+        page = Page.__new__(Page)
+        page.id_str = ids[first_id + stride - 2]
+        page.text = page_text
+        for (key, value) in kwargs.iteritems():
+            setattr(page, key, value)
+        if options:
+            page_options = []
+            for (i, column) in enumerate(option_texts):
+                option = Option.__new__(Option)
+                option.id_str = ids[first_id + i]
+                option.text = column[row]
+                page_options.append(option)
+            page.options = page_options
+        item = Item.__new__(Item)
+        item.id_str = ids[first_id + stride - 1]
+        item.contents = page
+        if conditions is not None:
+            item.condition = conditions[row]
+        if tags:
+            item.tags = dict([(name, values[row]) for (name, values) in zip(tags, tag_values)])
+        items.append(item)
+    return items
+
+def _column(frame, name):
+    '''Returns the named column of frame as a list of plain Python values.'''
+    column = frame[name]
+    return column.tolist() if hasattr(column, 'tolist') else list(column)
 
 class IDGenerator:
     '''Creates an object to generate unique IDs for experimental components. You
@@ -64,14 +152,22 @@ class IDGenerator:
         self.current_id += 1
         return str(self.current_id)
 
+    def _next_ids(self, n):
+        '''Returns a list of n new unique IDs, as _next_id would one at a time.'''
+        first = self.current_id + 1
+        self.current_id += n
+        return map(str, xrange(first, first + n))
+
 ### Makes the with statement possible
 
 def make_experiment(id_generator):
     '''id_generator: IDGenerator, an object that will make unique IDs for
     everything in an Experiment.
 
-    side effect: puts id_generator in scope for the duration of the with block.
-    Options, Pages, and Blocks will automatically use it to create unique IDs.
+    side effect: puts id_generator in scope for the duration of the with block,
+    in the thread that enters it. Options, Pages, and Blocks will automatically
+    use it to create unique IDs. Each thread building an experiment should
+    use its own with block and IDGenerator.
 
     Usage:
     with make_experiment(IDGenerator()):
@@ -81,21 +177,54 @@ def make_experiment(id_generator):
     '''
     return ExperimentMaker(id_generator)
 
-class ExperimentMaker():
+class ExperimentMaker(object):
     '''This class makes the "with" statement for automatic ID generation
-    possible. It sets an IDGenerator as a class variable in Component, making it
-    available to Options, Pages, and Blocks. At the end of the with block,
-    it is removed and any errors encountered in the block are raised.'''
+    possible. It is the context that components are built in: it holds the
+    IDGenerator that Options, Pages, Items, and Blocks use, and the numbers
+    that SampleFroms give their variables. During the with block it is the
+    build_context of the thread it was entered in, so experiments can be
+    built in several threads at once without sharing any of this state. At
+    the end of the with block, the previous context is restored and any
+    errors encountered in the block are raised.'''
     def __init__(self, id_generator):
         self.id_generator = id_generator
+        self.sampler_generators = {} # {bankname: IDGenerator}
+        self.variable_maps = {} # {bankname: {variablename: index}}
+
+    def variable_index(self, bank, variable):
+        '''Returns the number standing for variable among the variables of
+        bank, giving it the next one if it doesn't have one yet.'''
+        if bank not in self.sampler_generators:
+            self.sampler_generators[bank] = IDGenerator()
+            self.variable_maps[bank] = {}
+        mapping = self.variable_maps[bank]
+        if variable not in mapping:
+            mapping[variable] = self.sampler_generators[bank]._next_id()
+        return mapping[variable]
 
     def __enter__(self):
-        Component._id_generator = self.id_generator
+        _contexts.__dict__.setdefault('stack', []).append(self)
+        return self
 
     def __exit__(self, etype, evalue, etrace):
-        Component._id_generator = None
+        _contexts.stack.pop()
         return False # False means if you encountered errors, raise them
 
+# for each thread, the ExperimentMakers whose with blocks it is in, innermost
+# last, and the default context of the components it makes outside of any
+_contexts = threading.local()
+
+def build_context():
+    '''Returns the ExperimentMaker of the innermost with make_experiment block
+    this thread is in, or outside of any, one without an IDGenerator that the
+    thread's components made outside of with blocks share.'''
+    stack = getattr(_contexts, 'stack', None)
+    if stack:
+        return stack[-1]
+    if not hasattr(_contexts, 'default'):
+        _contexts.default = ExperimentMaker(None)
+    return _contexts.default
+
 def make_task(varname):
     '''Replace PsiTurk's example task.js with the standard Speriment task.js,
     with the JSON object variable name inserted.'''
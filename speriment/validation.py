@@ -0,0 +1,157 @@
+from speriment.compiler import attributes
+from speriment.components.block import Block
+from speriment.components.item import Item
+from speriment.components.page import Page
+from speriment.components.option import Option
+from speriment.components.resource import Resource
+from speriment.components.run_if import RunIf
+from speriment.components.sample_from import SampleFrom
+from speriment.samplers import SamplerIndex
+
+__all__ = []
+
+# attributes that refer to other components rather than containing them
+REFERENCES = frozenset(['treatments', 'item', 'page', 'option'])
+
+# types of values that can't contain components
+SCALARS = frozenset([str, unicode, int, long, float, bool, type(None)])
+
+class Validation(object):
+    '''Checks a whole Experiment in one pass over its components, without
+    compiling it. Each component's own _validate is run, and the IDs of the
+    Blocks, Items, Pages, and Options are indexed as they're found. Then IDs
+    used more than once, and RunIfs that refer to Pages or Options that aren't
+    in the experiment, are looked up in the indexes. The SampleFroms are
+    indexed by the bank they sample from in the same pass, and the banks are
+    checked against them. Every error is collected with the JSON path of the
+    component it was found in.
+
+    If banks_only is True, only the banks are checked, as they are before an
+    experiment is compiled.'''
+
+    def __init__(self, experiment, banks_only = False):
+        self.errors = [] # [string]
+        self.ids = dict([(kind, {}) for kind in [Block, Item, Page, Option]]) # {kind: {ID: path}}
+        self.kinds = {} # {type: the kind it's indexed as, or None}
+        self.options = {} # {page ID: set of the IDs of its Options}
+        self.run_ifs = [] # [(path, RunIf)]
+        self.samplers = SamplerIndex()
+        self.banks_only = banks_only
+        self._check(experiment, '$')
+        for (path, message) in self.samplers.problems():
+            self._error(path, message)
+        for (path, run_if) in self.run_ifs:
+            self._check_run_if(run_if, path)
+
+    def finish(self):
+        '''Raises a ValueError listing all errors found, if any.'''
+        if self.errors:
+            raise ValueError, 'The experiment is not valid:\n\n' + '\n'.join(self.errors)
+
+    def _error(self, path, message):
+        self.errors.append('{}: {}'.format(path, ' '.join(str(message).split())))
+
+    def _visit(self, value, path, skip = ()):
+        if hasattr(value, '_validate'):
+            self._check(value, path, skip)
+        elif isinstance(value, (list, tuple)):
+            for (i, v) in enumerate(value):
+                self._visit(v, '{}[{}]'.format(path, i), skip)
+        elif isinstance(value, dict):
+            for (key, v) in value.iteritems():
+                self._visit(v, '{}.{}'.format(path, key), skip)
+
+    def _check(self, component, path, skip = ()):
+        '''Validates component and the components it contains, leaving out
+        the attributes named in skip.'''
+        if isinstance(component, SampleFrom):
+            self.samplers.add(component, path)
+        if not self.banks_only:
+            try:
+                component._validate()
+            except ValueError as e:
+                self._error(path, e)
+            self._index(component, path)
+            if isinstance(component, RunIf):
+                self.run_ifs.append((path, component))
+        scope = self.samplers.enter(component, path)
+        names = getattr(component, '_json_names', {})
+        for (name, value) in attributes(component):
+            if type(value) in SCALARS or name in REFERENCES or name in skip:
+                continue
+            value_path = '{}.{}'.format(path, names.get(name, name))
+            if name in ['exchangeable', 'counterbalance']:
+                if not self.banks_only:
+                    self._check_ordering(component, name, value_path)
+            elif name == 'contents' and isinstance(component, Item):
+                self._check_pages(component, path + '.pages')
+            elif name == 'options':
+                # feedback left out of a Page is left out of its Options too
+                self._visit(value, value_path, skip)
+            elif name == 'resources' and type(value) == list:
+                self._visit([Resource(r) if isinstance(r, basestring) else r for r in value], value_path)
+            else:
+                self._visit(value, value_path)
+        self.samplers.scope = scope
+
+    def _check_pages(self, item, path):
+        '''Checks the Pages item displays, including feedback, which is
+        compiled as Pages of the Item.'''
+        try:
+            pages = item.compile_feedback(item.compile_item())
+        except (ValueError, AttributeError, TypeError, IndexError):
+            return # the Item's own _validate reports what's wrong with it
+        for (i, (page, kwargs)) in enumerate(pages):
+            page_path = '{}[{}]'.format(path, i)
+            self._check(page, page_path, kwargs.get('skip', ()))
+            if 'run_if' in kwargs and not self.banks_only:
+                self.run_ifs.append((page_path + '.runIf', kwargs['run_if']))
+
+    def _index(self, component, path):
+        if type(component) not in self.kinds:
+            self.kinds[type(component)] = next((kind for kind in self.ids
+                if isinstance(component, kind)), None)
+        kind = self.kinds[type(component)]
+        if kind is None or not hasattr(component, 'id_str'):
+            return
+        ids = self.ids[kind]
+        if component.id_str in ids:
+            self._error(path, '{} ID {} is already used at {}.'.format(
+                kind.__name__, component.id_str, ids[component.id_str]))
+        else:
+            ids[component.id_str] = path
+            if kind == Page:
+                self.options[component.id_str] = set(option.id_str
+                    for option in getattr(component, 'options', []) if hasattr(option, 'id_str'))
+
+    def _check_ordering(self, container, name, path):
+        '''Checks that the Block IDs in container's exchangeable or
+        counterbalance list are those of Blocks it contains.'''
+        contained = set(block.id_str for block in getattr(container, 'blocks', [])
+                if hasattr(block, 'id_str'))
+        for block_id in getattr(container, name):
+            if block_id not in contained:
+                self._error(path, '''{} is not the ID of one of the Blocks this
+                contains.'''.format(block_id))
+            elif name == 'counterbalance' and block_id in getattr(container, 'exchangeable', []):
+                self._error(path, '''Block {} can't be both exchangeable and
+                counterbalanced.'''.format(block_id))
+
+    def _check_run_if(self, run_if, path):
+        '''Checks that the Page and Option run_if refers to are in the
+        experiment, and that the Option belongs to the Page.'''
+        if hasattr(run_if, 'page'):
+            page_id = run_if.page.id_str
+        elif hasattr(run_if, 'item'):
+            try:
+                page_id = run_if.item.compile_item()[0].id_str
+            except (AttributeError, TypeError, IndexError):
+                return # reported by the RunIf's _validate
+        else:
+            return
+        if page_id not in self.ids[Page]:
+            self._error(path, '''RunIf refers to Page {}, which is not in the
+            experiment.'''.format(page_id))
+        elif hasattr(run_if, 'option') and run_if.option.id_str not in self.options[page_id]:
+            self._error(path, '''RunIf refers to Option {}, which is not one of
+            the Options of Page {}.'''.format(run_if.option.id_str, page_id))
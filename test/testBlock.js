@@ -259,6 +259,17 @@ test("test latin square", function(){
     ok(_.isEqual([b3.contents[0].contents[0].text, b3.contents[1].contents[0].text].sort(), ['1A', '2B']), 'latin square should work on excerpt from example JSON');
 });
 
+test("test precomputed latin square table", function(){
+    var gps = [[{id: '1a', text: '1a'}, {id: '1b', text: '1b'}], [{id: '2a', text: '2a'}, {id: '2b', text: '2b'}]];
+    var table = [[1, 1], [0, 0]];
+    var b1 = new InnerBlock({id: 'b1', groups: gps, latinSquare: true, latinSquareTable: table}, {version: 0, containerIDs: []});
+    var ids = _.map(b1.contents, function(item){return item.contents[0].id;}).sort();
+    ok(_.isEqual(ids, ['1b', '2b']), 'The table from the compiler should be used when given.');
+    var b2 = new InnerBlock({id: 'b2', groups: gps, latinSquare: true, latinSquareTable: table}, {version: 3, containerIDs: []});
+    var ids2 = _.map(b2.contents, function(item){return item.contents[0].id;}).sort();
+    ok(_.isEqual(ids2, ['1a', '2a']), 'Versions beyond the number of conditions should wrap around.');
+});
+
 test("test latin square with multi-page items", function(){
     var gps = [
       [
@@ -319,6 +330,26 @@ test("ordering pages", function(){
     strictEqual(clashes.length, 0, "no two adjacent conditions should be the same when pseudorandomized (deterministic)");
 });
 
+test("pseudorandomizing the shared cases", function(){
+    // the same cases are checked at compile time in speriment/test/test_speriment.py
+    var cases = $.ajax({url: 'pseudorandom_cases.json', dataType: 'json', async: false}).responseJSON;
+    _.each(cases, function(c){
+        var pgs = _.map(c.conditions, function(cond, i){return {text: 'page ' + i, id: 'p' + i, condition: cond};});
+        var jsonb = {id: "b1", pages: pgs, pseudorandom: true};
+        if (!c.feasible){
+            throws(function(){new InnerBlock(jsonb, fakeContainer);}, "infeasible conditions should throw: " + c.conditions);
+            return;
+        }
+        _.each(_.range(20), function(){
+            var b = new InnerBlock(jsonb, fakeContainer);
+            var conditions = _.pluck(b.contents, "condition");
+            var clashes = _.filter(_.zip(conditions, _.rest(conditions)), function(pair){return pair[0] === pair[1];});
+            strictEqual(clashes.length, 0, "no two adjacent conditions should be the same: " + conditions);
+            strictEqual(conditions.sort().join(), _.clone(c.conditions).sort().join(), "pseudorandomize should keep every page");
+        });
+    });
+});
+
 
 function clickNext(){$(":button").trigger("click");}
 function CustomError( message ) {
@@ -1232,3 +1263,37 @@ test('training shuffles pages and options', function(){
     ok(_.contains(sameFirstOptions, false), 'first option varies across loops over the block');
     cleanUp();
 });
+
+test('prefetching upcoming resources', function(){
+    var prefetcher = new Prefetcher(2, 3);
+    var container = _.extend({}, fakeContainer, {prefetcher: prefetcher});
+    var b = new InnerBlock({id: 'b', pages: [
+        {id: 'p1', text: 'one', resources: ['a.jpg']},
+        {id: 'p2', text: 'two', resources: ['b.jpg', 'c.mp3']},
+        {id: 'p3', text: 'three', options: [{id: 'o1', text: 'A', resources: ['d.png']}]},
+        {id: 'p4', text: 'four', resources: ['e.jpg']}]}, container);
+    b.contents = _.sortBy(b.contents, 'id');
+    strictEqual(b.prefetcher, prefetcher, 'blocks use their container\'s prefetcher');
+
+    prefetcher.prefetch(b.contents);
+    deepEqual(prefetcher.order, ['a.jpg', 'b.jpg', 'c.mp3'], 'the first pages\' resources are loaded');
+
+    var item = b.contents.shift();
+    var page = item.contents.shift();
+    prefetcher.prefetchAfter(page);
+    deepEqual(prefetcher.order, ['b.jpg', 'c.mp3', 'd.png'], 'options\' resources are loaded, and the least recently needed are dropped');
+
+    ok(prefetcher.take({source: 'b.jpg'}), 'loaded elements are used when their page displays');
+    strictEqual(prefetcher.take({source: 'b.jpg'}), null, 'and only once');
+    strictEqual(prefetcher.take({source: 'a.jpg'}), null, 'dropped elements are loaded again');
+});
+
+test('bundled resource files', function(){
+    var files = {'a.jpg': {url: 'static/resources/a.0123.jpg', mediaType: 'img', bytes: 10}};
+    var bundled = normalizeResource({source: 'a.jpg', autoplay: false, controls: true}, files);
+    strictEqual(bundled.source, 'static/resources/a.0123.jpg', 'bundled files are loaded from their copies');
+    strictEqual(bundled.name, 'a.jpg', 'and recorded by the source they were given as');
+    var sampled = normalizeResource('b.mp3', files);
+    strictEqual(sampled.source, 'b.mp3', 'other files are loaded as given');
+    strictEqual(sampled.mediaType, 'audio', 'with their type taken from their extension');
+});
@@ -352,3 +352,63 @@ test("zip option tags", function(){
     var zipped = t.zipOptionTags([{tag1: 'a', tag2: 'b'}, {tag1: 'c'}, {tag3: 'd', tag2: 'e'}]);
     ok(_.isEqual(zipped, {tag1: ['a', 'c', 'NA'], tag2: ['b', 'NA', 'e'], tag3: ['NA', 'NA', 'd']}), "zipOptionTags works");
 });
+
+test("block grades", function(){
+    var er = new ExperimentRecord(null, 0);
+    var answer = function(pageID, correct){
+        var t = new TrialRecord(pageID, '', null, 'i' + pageID, {}, ['outer', 'b1'], {}, []);
+        t.addResponseData([0], ['o1'], ['o1'], correct);
+        er.addRecord(t);
+    };
+    answer('p1', [true]);
+    answer('p2', [false]);
+    answer('p3', [true, true]);
+    answer('p4', [null]);
+    strictEqual(er.getStreak('b1'), 2, "streak counts grades after the last incorrect one");
+    strictEqual(er.getPercentCorrect('b1'), 0.75, "ungraded responses don't count");
+    answer('p2', [true]);
+    ok(_.isEqual(er.getBlockGrades('b1'), [true, true, true, true]), "only the latest iteration of a page is graded, in order");
+    strictEqual(er.getStreak('b1'), 4, "a superseded incorrect answer no longer breaks the streak");
+    strictEqual(er.getPercentCorrect('outer'), 1, "records are graded in every block containing them");
+    ok(er.responseGiven('p2', 'o1'), "responses are looked up by option ID");
+    ok(_.isNaN(er.getPercentCorrect('b2')) && er.getStreak('b2') === 0, "blocks without records have no grades");
+});
+
+test("flushing records", function(){
+    var saved = [];
+    var saves = 0;
+    var psiturk = {recordTrialData: function(row){saved.push(row);}, saveData: function(){saves += 1;}};
+    var er = new ExperimentRecord(psiturk, 0, 2);
+    var answer = function(pageID){
+        var t = new TrialRecord(pageID, '', null, 'i' + pageID, {}, ['b1'], {}, []);
+        t.addResponseData([0], ['o1'], ['o1'], [true]);
+        er.addRecord(t);
+    };
+    answer('p1');
+    strictEqual(saves, 0, "records wait until there are flushTrials of them");
+    answer('p2');
+    strictEqual(saves, 1, "records are saved every flushTrials trials");
+    answer('p1');
+    er.submitRecords();
+    strictEqual(saves, 2, "the rest are saved at the end");
+    ok(_.isEqual(_.pluck(saved, 'TrialKey'), ['p1:1', 'p2:1', 'p1:2']), "each record is sent once, in order, with a key");
+});
+
+test("compact trial data", function(){
+    var t = new TrialRecord('p1', 'some long question', 'c1', 'i1', {itag: 'a'}, ['b1'], {}, ['pic.jpg']);
+    t.addOptionData(['o2', 'o1'], ['no', 'yes'], [[], []], [{}, {}]);
+    t.addResponseData([1], ['o1'], ['yes'], [true]);
+    var row = t.writeCompactData();
+    ok(_.isEqual(_.keys(row).sort(), ['CachedResources', 'Correct', 'EndTime', 'Iteration', 'OptionOrder', 'PageID', 'Sampled', 'SelectedID', 'SelectedPosition', 'StartTime', 'TrialKey']),
+        "texts, resources, tags, and containers are left out");
+    ok(_.isEmpty(row['Sampled']), "nothing was sampled");
+
+    var s = new TrialRecord('p2', 'cat', null, 'i2', {}, ['b1'], {}, [], {PageText: 'cat'});
+    s.addOptionData(['o3'], ['dog'], [[]], [{}], true);
+    s.addResponseData([0], ['o3'], ['a dog'], [null]);
+    var sampledRow = s.writeCompactData();
+    strictEqual(sampledRow['Sampled']['PageText'], 'cat', "sampled page values are kept");
+    ok(_.isEqual(sampledRow['Sampled']['OptionTexts'], ['dog']), "sampled option values are kept");
+    strictEqual(sampledRow['SelectedText'][0], 'a dog', "text that isn't an option's is kept");
+    ok(_.isEqual(s.reset().writeCompactData()['Sampled'], {PageText: 'cat'}), "sampled values survive a reset");
+});
@@ -24,6 +24,8 @@ class Block implements Resettable{
      * recorded. Block iterations are just used to determine if the cutoff for
      * looping has been reached. */
     iteration: number;
+    prefetcher: Prefetcher; // null if resources aren't loaded ahead of time
+    resourceFiles; // {source: {url, mediaType, bytes}}, resource files bundled by the compiler
 
     constructor(jsonBlock, public container: Container){
         jsonBlock = _.defaults(jsonBlock, {runIf: null, banks: {}, criterion: null, cutoff: 1});
@@ -35,6 +37,8 @@ class Block implements Resettable{
         this.banks = shuffleBanks(jsonBlock.banks);
         this.oldContents = [];
         this.containerIDs = this.container.containerIDs.concat(this.id);
+        this.prefetcher = this.container.prefetcher || null;
+        this.resourceFiles = this.container.resourceFiles || {};
     }
 
     run(experimentRecord: ExperimentRecord){
@@ -59,17 +63,15 @@ class Block implements Resettable{
             return false;
         }
         else {
-            var grades: boolean[] = experimentRecord.getBlockGrades(this.id);
             var metric: number;
 
             // this.criterion is necessary percent correct
             if (this.criterion < 1){
-                metric = _.compact(grades).length / grades.length;
+                metric = experimentRecord.getPercentCorrect(this.id);
 
             // this.criterion is necessary number correct in a row from the end
             } else {
-                var lastIncorrect = _.lastIndexOf(grades, false);
-                var metric = grades.length - (lastIncorrect + 1);
+                metric = experimentRecord.getStreak(this.id);
             }
 
             return metric < this.criterion;
@@ -110,12 +112,17 @@ class OuterBlock extends Block implements Container{
 class InnerBlock extends Block{
     contents: Item[];
     private latinSquare: boolean;
+    /* For each version modulo the number of conditions, the index of the
+     * member to choose from each group. Precomputed and validated by the
+     * compiler; built here only for hand-written JSON that lacks it. */
+    private latinSquareTable: number[][];
     private pseudorandom: boolean;
 
     constructor(jsonBlock, public container: Container){
         super(jsonBlock, container);
-        jsonBlock = _.defaults(jsonBlock, {latinSquare: false, pseudorandom: false});
+        jsonBlock = _.defaults(jsonBlock, {latinSquare: false, latinSquareTable: null, pseudorandom: false});
         this.latinSquare = jsonBlock.latinSquare;
+        this.latinSquareTable = jsonBlock.latinSquareTable;
         this.pseudorandom = jsonBlock.pseudorandom;
         if (jsonBlock.groups){
             this.contents = this.chooseItems(jsonBlock.groups, container.version);
@@ -158,18 +165,20 @@ class InnerBlock extends Block{
     }
 
     private chooseLatinSquare(groups, version): any[]{
+        var table = this.latinSquareTable || this.makeLatinSquareTable(groups);
+        var chosen: number[] = table[version % table.length];
+        return _.map(groups, (group: any[], i: number) => {return group[chosen[i]]});
+    }
+
+    private makeLatinSquareTable(groups): number[][]{
         var numConditions = groups[0].length;
         var lengths = _.pluck(groups, "length");
-        var items = [];
-        if (_.every(lengths, (l:number):boolean => {return l === lengths[0]})){
-            for (var i = 0; i < groups.length; i++){
-                var cond = (i + version) % numConditions;
-                items.push(groups[i][cond]);
-            }
-        } else {
+        if (!_.every(lengths, (l:number):boolean => {return l === numConditions})){
             throw "Can't do Latin Square on groups of uneven sizes.";
         }
-        return items;
+        return _.map(_.range(numConditions), (version: number) => {
+            return _.map(_.range(groups.length), (i: number) => {return (i + version) % numConditions});
+        });
     }
 
     private chooseRandom(groups): any[]{
@@ -177,44 +186,59 @@ class InnerBlock extends Block{
         return items;
     }
 
-    private swapInto(nextItem: Item, items: Item[]): Item[]{
-        var conds = _.pluck(items, 'condition');
-        var cond = nextItem.condition;
-        var swappable = _.map(_.range(items.length), (i):boolean =>{
-            var firstIndex = (i === 0) ? 0 : i-1;
-            return _.isEmpty(_.intersection(conds.slice(firstIndex, i+2), [cond]));
-        });
-        var swapTo = _.indexOf(swappable, true);
-        if (swapTo > -1){
-            items.push(items[swapTo]);
-            items[swapTo] = nextItem;
-            return items;
-        } else {
-            throw "Pseudorandomization may not work if there are not an equal number of all conditions.";
-        }
-    }
-
+    /* Orders contents randomly so that no two Items with the same condition
+     * are adjacent, in expected linear time. Items are drawn at random,
+     * redrawing any that share the previous Item's condition, until one
+     * condition makes up more than half of the Items left. From then on, that
+     * condition has to alternate with the rest. */
     private pseudorandomize(): void{
         if (_.any(this.contents, (item: Item) => {return _.isUndefined(item.condition);})){
             throw "Can't pseudorandomize if not all pages have a condition.";
         }
+        var remaining: Item[] = this.contents.slice();
+        var left: number = remaining.length;
+        var counts = _.countBy(remaining, (item: Item) => {return String(item.condition);});
+        // numWithCount[k] is the number of conditions with k Items left
+        var numWithCount: number[] = _.map(_.range(left + 1), () => {return 0;});
+        var maxCount = 0;
+        _.each(counts, (count: number) => {
+            numWithCount[count] += 1;
+            maxCount = Math.max(maxCount, count);
+        });
+        if (maxCount * 2 > left + 1){
+            throw "Can't pseudorandomize if more than half of the pages have the same condition.";
+        }
         var items: Item[] = [];
-        var remaining: Item[] = _.shuffle<Item>(this.contents);
-        items.push(remaining.shift());
-        _.each(_.range(remaining.length), (i) => {
-            var conds = _.pluck(remaining, 'condition');
-            var cond = _.last(items).condition;
-            var addable = _.map(conds, (c)=>{
-                return c != cond;
-            });
-            var addFrom = _.indexOf(addable, true);
-            if (addFrom > -1){
-                items.push(remaining.splice(addFrom, 1)[0]);
-            } else {
-                var nextItem: Item = remaining.shift();
-                items = this.swapInto(nextItem, items);
+        var last: string = null;
+        while (left > 0 && maxCount * 2 <= left){
+            var i = _.random(left - 1);
+            var cond = String(remaining[i].condition);
+            if (cond === last){
+                continue;
             }
-        });
+            items.push(remaining[i]);
+            remaining[i] = remaining[left - 1];
+            left -= 1;
+            last = cond;
+            var count: number = counts[cond];
+            counts[cond] = count - 1;
+            numWithCount[count] -= 1;
+            numWithCount[count - 1] += 1;
+            if (count === maxCount && numWithCount[count] === 0){
+                maxCount -= 1;
+            }
+        }
+        if (left > 0){
+            var critical = _.find(_.keys(counts), (c: string) => {return counts[c] === maxCount;});
+            var split = _.partition(remaining.slice(0, left), (item: Item) => {return String(item.condition) === critical;});
+            var others: Item[] = _.shuffle<Item>(split[1]);
+            _.each(split[0], (item: Item, j: number) => {
+                items.push(item);
+                if (j < others.length){
+                    items.push(others[j]);
+                }
+            });
+        }
         this.contents = items;
     }
 }
@@ -15,6 +15,8 @@ interface Container{
     contents;
     containerIDs: string[];
     banks;
+    prefetcher: Prefetcher;
+    resourceFiles;
 
     run(experimentRecord: ExperimentRecord): void;
 }
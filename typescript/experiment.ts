@@ -23,15 +23,19 @@ class Experiment implements Container{
     public containerIDs: string[] = [];
     public experimentRecord: ExperimentRecord;
     public banks;
+    public prefetcher: Prefetcher;
+    public resourceFiles;
 
     constructor(jsonExperiment, version, permutation, psiturk){
-        jsonExperiment = _.defaults(jsonExperiment, {exchangeable: [], counterbalance: [], banks: {}});
+        jsonExperiment = _.defaults(jsonExperiment, {exchangeable: [], counterbalance: [], banks: {}, flushTrials: null, flushSeconds: null, compactTrials: false, prefetchPages: 3, prefetchCache: 20, resourceFiles: {}});
         this.version = parseInt(version);
         this.permutation = parseInt(permutation);
         this.exchangeable = jsonExperiment.exchangeable;
         this.counterbalance = jsonExperiment.counterbalance;
         this.banks = shuffleBanks(jsonExperiment.banks);
-        this.experimentRecord = new ExperimentRecord(psiturk, this.permutation);
+        this.experimentRecord = new ExperimentRecord(psiturk, this.permutation, jsonExperiment.flushTrials, jsonExperiment.flushSeconds, jsonExperiment.compactTrials);
+        this.resourceFiles = jsonExperiment.resourceFiles;
+        this.prefetcher = jsonExperiment.prefetchPages > 0 ? new Prefetcher(jsonExperiment.prefetchPages, jsonExperiment.prefetchCache) : null;
 
         this.contents = makeBlocks(jsonExperiment.blocks, this);
         this.contents = orderBlocks(this.contents, this.exchangeable, this.permutation, this.counterbalance);
@@ -39,6 +43,9 @@ class Experiment implements Container{
 
     public start(){
         Experiment.addElements();
+        if (this.prefetcher){
+            this.prefetcher.prefetch(this.contents);
+        }
         this.run(this.experimentRecord);
     }
 
@@ -16,10 +16,13 @@ class ResponseOption implements Viewable, Resettable{
     public resources: string[];
     public runIf: RunIf;
     public element;
+    public sampled: boolean; // whether any of text, resources, and tags are sampled from banks
 
     constructor(jsonOption, public question: Question){
         jsonOption = _.defaults(jsonOption, {feedback: null, correct: null, tags: [], text: null, resources: null});
         this.id = jsonOption.id;
+        this.sampled = isSampled(jsonOption.text) || isSampled(jsonOption.resources) ||
+            _.any(_.values(jsonOption.tags), isSampled);
         this.text = setText(jsonOption.text, this.question.block);
         this.feedback = getFeedback(jsonOption.feedback, this.id, this.question.item);
         this.resourceNames = _.map(jsonOption.resources, (r) => {return setOrSample(r, this.question.block)});
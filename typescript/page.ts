@@ -2,6 +2,7 @@
 /// <reference path="block.ts"/>
 /// <reference path="option.ts"/>
 /// <reference path="viewable.ts"/>
+/// <reference path="prefetch.ts"/>
 /// <reference path="../typings/jquery/jquery.d.ts" />
 /// <reference path="../typings/underscore/underscore.d.ts" />
 
@@ -21,6 +22,7 @@ class Page implements Viewable, Resettable{
         jsonPage = _.defaults(jsonPage, {condition: null, resources: null, tags: []});
         this.block = this.item.block;
         this.id = jsonPage.id;
+        var sampledTags = _.filter(_.keys(jsonPage.tags), (key) => {return isSampled(jsonPage.tags[key])});
         this.text = setText(jsonPage.text, this.block);
         this.condition = setOrSample(jsonPage.condition, this.block);
         this.resourceNames = _.map(jsonPage.resources, (r) => {return setOrSample(r, this.block)});
@@ -35,7 +37,27 @@ class Page implements Viewable, Resettable{
                 this.item.tags,
                 this.block.containerIDs,
                 this.tags,
-                this.resourceNames);
+                this.resourceNames,
+                this.sampledValues(jsonPage, sampledTags));
+    }
+
+    // the values of this page that were sampled from banks, which compact
+    // trial data has to record because they can't be looked up by ID
+    private sampledValues(jsonPage, sampledTags: string[]){
+        var sampled = {};
+        if (isSampled(jsonPage.text)){
+            sampled['PageText'] = this.text;
+        }
+        if (isSampled(jsonPage.condition)){
+            sampled['Condition'] = this.condition;
+        }
+        if (isSampled(jsonPage.resources)){
+            sampled['PageResources'] = this.resourceNames;
+        }
+        if (!_.isEmpty(sampledTags)){
+            sampled['Tags'] = _.pick(this.tags, sampledTags);
+        }
+        return sampled;
     }
 
     public advance(experimentRecord):void {}
@@ -69,6 +91,18 @@ class Page implements Viewable, Resettable{
         $(CONTINUE).show();
     }
 
+    // the resources this page displays, including those of its options
+    public allResourceNames(){
+        return this.resourceNames;
+    }
+
+    // starts loading the resources of the pages that will run next
+    public prefetch(){
+        if (this.block.prefetcher){
+            this.block.prefetcher.prefetchAfter(this);
+        }
+    }
+
     public run(experimentRecord){
         if (this.runIf.shouldRun(experimentRecord)){
             this.display(experimentRecord);
@@ -134,6 +168,7 @@ class Question extends Page{
         var resources = _.map(this.resourceNames, (rn) => makeResource(rn, this));
         $(RESOURCES).empty().append(_.map(resources, this.wrapResource));
         this.record.setStartTime(new Date().getTime());
+        this.prefetch();
     }
 
     public advance(experimentRecord): void{
@@ -185,7 +220,12 @@ class Question extends Page{
         var optionTexts = _.pluck(this.options, 'text');
         var optionResources = _.pluck(this.options, 'resourceNames');
         var optionTags = _.pluck(this.options, 'tags');
-        this.record.addOptionData(optionOrder, optionTexts, optionResources, optionTags);
+        var optionsSampled = _.any(this.options, (o) => {return o.sampled});
+        this.record.addOptionData(optionOrder, optionTexts, optionResources, optionTags, optionsSampled);
+    }
+
+    allResourceNames(){
+        return this.resourceNames.concat(_.flatten(_.pluck(this.options, 'resourceNames'), true));
     }
 
     waitForResource(){
@@ -206,6 +246,7 @@ class Statement extends Page{
         var resources = _.map(this.resourceNames, (rn) => makeResource(rn, this));
         $(RESOURCES).empty().append(_.map(resources, this.wrapResource));
         this.record.setStartTime(new Date().getTime());
+        this.prefetch();
     }
 
     public advance(experimentRecord){
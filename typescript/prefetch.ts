@@ -0,0 +1,95 @@
+/// <reference path="experiment.ts"/>
+/// <reference path="block.ts"/>
+/// <reference path="item.ts"/>
+/// <reference path="page.ts"/>
+/// <reference path="viewable.ts"/>
+/// <reference path="../typings/underscore/underscore.d.ts" />
+
+/* Loads the images, audio, and video of upcoming pages while the current one
+ * is displayed, so that loading them doesn't delay their display and skew
+ * their StartTime. At most capacity loaded elements are kept; when there are
+ * more, the ones warmed least recently are dropped. */
+class Prefetcher {
+    private elements; // {source: element}, loaded but not yet displayed
+    private order: string[]; // sources in elements, least recently warmed first
+
+    constructor(private lookahead: number, private capacity: number){
+        this.elements = {};
+        this.order = [];
+    }
+
+    // loads the resources of the next lookahead pages of contents, a list of
+    // Blocks, Items, or Pages in the order they'll run
+    public prefetch(contents): void {
+        this.warmPages(collectPages([contents], this.lookahead));
+    }
+
+    // loads the resources of the next lookahead pages to run after page
+    public prefetchAfter(page: Page): void {
+        var levels = [page.item.contents];
+        var container: any = page.block;
+        while (container){
+            levels.push(container.contents);
+            container = container.container;
+        }
+        this.warmPages(collectPages(levels, this.lookahead));
+    }
+
+    /* Returns the element loaded ahead of time for resource, which may not
+     * have finished loading, and forgets it so that it's only displayed once.
+     * Returns null if there isn't one. */
+    public take(resource){
+        var source = resource.source;
+        if (!_.has(this.elements, source)){
+            return null;
+        }
+        var element = this.elements[source];
+        delete this.elements[source];
+        this.order = _.without(this.order, source);
+        return element;
+    }
+
+    private warmPages(pages: Page[]): void {
+        _.each(pages, (p) => {
+            _.each(p.allResourceNames(), (r) => {this.warm(normalizeResource(r, p.block.resourceFiles))});
+        });
+    }
+
+    private warm(resource): void {
+        var source = resource.source;
+        if (_.has(this.elements, source)){
+            this.order = _.without(this.order, source);
+        } else {
+            this.elements[source] = loadResource(resource);
+        }
+        this.order.push(source);
+        while (this.order.length > this.capacity){
+            delete this.elements[this.order.shift()];
+        }
+    }
+}
+
+/* Returns up to limit Pages, in the order they would run, from levels, a list
+ * of lists of Blocks, Items, and Pages. */
+function collectPages(levels, limit: number): Page[] {
+    var pages: Page[] = [];
+    var collect = (node) => {
+        if (node instanceof Page){
+            pages.push(node);
+        } else {
+            for (var i = 0; i < node.contents.length && pages.length < limit; i++){
+                collect(node.contents[i]);
+            }
+        }
+    };
+    _.each(levels, (contents) => {collect({contents: contents || []})});
+    return pages;
+}
+
+function isLoaded(element): boolean {
+    if (element instanceof HTMLImageElement){
+        return element.complete && element.naturalWidth > 0;
+    } else {
+        return element.readyState >= 4; // HAVE_ENOUGH_DATA
+    }
+}
@@ -20,13 +20,21 @@ class TrialRecord {
     private optionTexts: string[]; // can be sampled
     private optionResources: string[][]; // can be sampled
     private optionTags: Object;
+    private optionsSampled: boolean;
+    // values sampled from banks, {column: value}
+    private sampled: Object;
     // response data
     private selectedPosition: number[];
     private selectedID: string[]; // redundant but used by RunIf
     private selectedText: string[]; // needed for text options
+    private selectedIDSet; // {optionID: true}, for responseGiven
     private correct;
+    // sources of resources that had finished loading ahead of time when displayed
+    private cachedResources: string[];
 
-    constructor(pageID: string, pageText: string, condition: string, item: string, itemTags: Object, containers: string[], tags: Object, resources: string[]){
+    constructor(pageID: string, pageText: string, condition: string, item: string, itemTags: Object, containers: string[], tags: Object, resources: string[], sampled: Object = {}){
+        this.sampled = sampled;
+        this.cachedResources = [];
         this.pageID = pageID;
         this.pageText = pageText;
         this.condition = condition;
@@ -41,11 +49,16 @@ class TrialRecord {
         return this.pageID;
     }
 
-    addOptionData(optionOrder, optionText, optionResources, optionTags){
+    addOptionData(optionOrder, optionText, optionResources, optionTags, optionsSampled = false){
         this.optionOrder = optionOrder;
         this.optionTexts = optionText;
         this.optionResources = optionResources;
         this.optionTags = this.zipOptionTags(optionTags);
+        this.optionsSampled = optionsSampled;
+    }
+
+    addCachedResource(source: string){
+        this.cachedResources.push(source);
     }
 
     addResponseData(selectedPosition, selectedID, selectedText, correct){
@@ -53,6 +66,19 @@ class TrialRecord {
         this.selectedID = selectedID;
         this.selectedText = selectedText;
         this.correct = correct;
+        this.selectedIDSet = {};
+        _.each(selectedID, (id: string) => {this.selectedIDSet[id] = true;});
+    }
+
+    // correctness info with nonexclusive responses flattened, leaving out
+    // responses with no specified answer
+    getGrades(): boolean[] {
+        var grades: boolean[] = _.flatten([this.correct]);
+        return _.reject<boolean>(grades, (g) => {return _.isNull(g) || _.isUndefined(g)});
+    }
+
+    getBlockIDs(): string[] {
+        return this.blockIDs;
     }
 
     getStartTime(){
@@ -76,7 +102,7 @@ class TrialRecord {
     }
 
     reset(): TrialRecord {
-        return new TrialRecord(this.pageID, this.pageText, this.condition, this.itemID, this.itemTags, this.blockIDs, this.pageTags, this.pageResources);
+        return new TrialRecord(this.pageID, this.pageText, this.condition, this.itemID, this.itemTags, this.blockIDs, this.pageTags, this.pageResources, this.sampled);
     }
 
     zipOptionTags(optionTags: any[]): Object{
@@ -94,7 +120,7 @@ class TrialRecord {
     }
 
     responseGiven(optionID){
-        return _.contains(this.selectedID, optionID);
+        return _.has(this.selectedIDSet, optionID);
     }
 
     textMatch(regex){
@@ -114,6 +140,8 @@ class TrialRecord {
             StartTime: this.startTime,
             EndTime: this.endTime,
             Iteration: this.iteration,
+            // identifies this row among the participant's, even if it's saved more than once
+            TrialKey: this.pageID + ':' + this.iteration,
             Condition: this.condition,
             SelectedID: this.selectedID,
             SelectedText: this.selectedText,
@@ -122,12 +150,48 @@ class TrialRecord {
             SelectedPosition: this.selectedPosition,
             PageResources: this.pageResources,
             OptionTexts: this.optionTexts,
-            OptionResources: this.optionResources
+            OptionResources: this.optionResources,
+            CachedResources: this.cachedResources
             }
         _.extend(row, this.itemTags, this.pageTags, this.optionTags);
         return row;
     }
 
+    /* Like writeData, but leaves out everything that speriment-output can look
+       up by ID in the compiled experiment: texts, resources, tags, blocks, and
+       the item. Values sampled from banks are kept, under Sampled, as is
+       SelectedText if it isn't just the selected options' texts. */
+    writeCompactData(){
+        var row = {
+            PageID: this.pageID,
+            StartTime: this.startTime,
+            EndTime: this.endTime,
+            Iteration: this.iteration,
+            TrialKey: this.pageID + ':' + this.iteration,
+            SelectedID: this.selectedID,
+            Correct: this.correct,
+            OptionOrder: this.optionOrder,
+            SelectedPosition: this.selectedPosition,
+            CachedResources: this.cachedResources,
+            Sampled: _.clone(this.sampled)
+            };
+        if (this.optionsSampled){
+            _.extend(row.Sampled, {
+                OptionTexts: this.optionTexts,
+                OptionResources: this.optionResources,
+                OptionTags: this.optionTags
+            });
+        }
+        if (!_.isUndefined(this.selectedText)){
+            var optionTexts = _.object(this.optionOrder, this.optionTexts);
+            var selectedOptionTexts = _.map(this.selectedID, (id: string) => {return optionTexts[id]});
+            if (!_.isEqual(selectedOptionTexts, this.selectedText)){
+                row['SelectedText'] = this.selectedText;
+            }
+        }
+        return row;
+    }
+
 }
 
 /* Each record is actually an array of TrialRecords, in case the
@@ -138,16 +202,36 @@ class TrialRecord {
    So in an experiment where block 2 runs only if a certain answer was given in
    block 1, or block 2 reruns if not enough correct answers were given in it,
    these decisions will be made based on the most recent answers.
+
+   If flushTrials or flushSeconds is given, records are also sent to PsiTurk and
+   saved in batches as the experiment goes: every flushTrials records, every
+   flushSeconds seconds, and whenever MAX_PENDING records are waiting.
 */
 class ExperimentRecord {
+    static MAX_PENDING = 500;
     private trialRecords; // {pageID: TrialRecord[]}
+    private blockGrades; // {blockID: BlockGrades}
     private psiturk;
     private permutation: number;
+    private flushTrials: number; // null if records are only sent at the end
+    private compactTrials: boolean;
+    private pending: TrialRecord[]; // records not yet sent to PsiTurk, in order
+    private flushTimer;
 
-    constructor(psiturk, permutation){
+    constructor(psiturk, permutation, flushTrials?: number, flushSeconds?: number, compactTrials: boolean = false){
         this.psiturk = psiturk;
+        this.compactTrials = compactTrials;
         this.trialRecords = {};
+        this.blockGrades = {};
         this.permutation = permutation;
+        this.pending = [];
+        this.flushTrials = null;
+        if (flushTrials || flushSeconds){
+            this.flushTrials = Math.min(flushTrials || ExperimentRecord.MAX_PENDING, ExperimentRecord.MAX_PENDING);
+        }
+        if (flushSeconds){
+            this.flushTimer = setInterval(() => {this.flush()}, flushSeconds * 1000);
+        }
     }
 
     public addRecord(pageRecord: TrialRecord): void {
@@ -160,6 +244,29 @@ class ExperimentRecord {
             pageRecord.setIteration(this.trialRecords[pageID].length + 1);
             this.trialRecords[pageID].push(pageRecord);
         }
+        _.each(pageRecord.getBlockIDs(), (blockID: string) => {
+            if (!_.has(this.blockGrades, blockID)){
+                this.blockGrades[blockID] = new BlockGrades();
+            }
+            this.blockGrades[blockID].add(pageRecord);
+        });
+        if (this.flushTrials){
+            this.pending.push(pageRecord);
+            if (this.pending.length >= this.flushTrials){
+                this.flush();
+            }
+        }
+    }
+
+    /* Sends the pending records to PsiTurk and saves them. If the save fails,
+       PsiTurk still has them, and sends them again with the next save. */
+    private flush(): void {
+        if (!_.isEmpty(this.pending)){
+            var dataObjects = _.map(this.pending, (r) => {return this.writeData(r)});
+            this.pending = [];
+            _.each(dataObjects, this.psiturk.recordTrialData);
+            this.psiturk.saveData();
+        }
     }
 
     getPermutation(): number {
@@ -193,33 +300,164 @@ class ExperimentRecord {
         }
     }
 
+    // the grades of the last iteration of each page in the block, in order
     public getBlockGrades(blockID: string): boolean[] {
-        // get the last iteration of each page
-        var recentRecords: TrialRecord[] = _.map(this.trialRecords, (tr: TrialRecord[]) => {return _.last(tr)});
-        // get only records contained by the given block
-        var relevantRecords: TrialRecord[] = _.filter(recentRecords, (tr: TrialRecord) => {
-            return tr.inBlock(blockID);
-        });
-        // order by time so you can check the number correct in a row
-        var orderedRecords = this.sortByStart(relevantRecords);
-        // gather correctness info, flatten nonexclusive responses
-        var grades = _.flatten(_.pluck(orderedRecords, "correct"));
-        // correct answers separated by pages with no specified answers count as in a row
-        grades = _.reject<boolean[]>(grades, (g) => {return _.isNull(g) || _.isUndefined(g)});
-        return grades;
+        return _.has(this.blockGrades, blockID) ? this.blockGrades[blockID].getGrades() : [];
+    }
+
+    // the proportion of the block's grades that are correct (NaN if none are
+    // graded)
+    public getPercentCorrect(blockID: string): number {
+        return _.has(this.blockGrades, blockID) ? this.blockGrades[blockID].percentCorrect() : NaN;
+    }
+
+    // the number of grades in the block since the last incorrect one
+    public getStreak(blockID: string): number {
+        return _.has(this.blockGrades, blockID) ? this.blockGrades[blockID].streak() : 0;
     }
 
     public submitRecords(): void {
-        var records = _.toArray(this.trialRecords);
-        var flatRecords = _.flatten(records);
-        var orderedRecords = this.sortByStart(flatRecords);
-        var dataObjects = _.map(orderedRecords, (r) => {return r.writeData()});
+        var orderedRecords: TrialRecord[];
+        if (this.flushTrials){
+            // the rest have already been sent, in order
+            clearInterval(this.flushTimer);
+            orderedRecords = this.pending;
+            this.pending = [];
+        } else {
+            var records = _.toArray(this.trialRecords);
+            var flatRecords = _.flatten(records);
+            orderedRecords = this.sortByStart(flatRecords);
+        }
+        var dataObjects = _.map(orderedRecords, (r) => {return this.writeData(r)});
         _.each(dataObjects, this.psiturk.recordTrialData);
         this.psiturk.saveData({success: this.psiturk.completeHIT, error: this.psiturk.completeHIT});
     }
 
+    private writeData(record: TrialRecord){
+        return this.compactTrials ? record.writeCompactData() : record.writeData();
+    }
+
     private sortByStart(records: TrialRecord[]): TrialRecord[] {
         return records.sort((r1, r2) => {return r1.getStartTime() - r2.getStartTime()});
     }
 
 }
+
+/* A run of grades between two incorrect answers in a block. When the record
+   with the incorrect answer ending a run is superseded, its run is merged into
+   the next one, so the records in it don't have to be visited again. */
+class GradeRun {
+    length: number = 0;
+    private mergedInto: GradeRun = null;
+
+    root(): GradeRun {
+        var run: GradeRun = this;
+        while (run.mergedInto){
+            run = run.mergedInto;
+        }
+        var next: GradeRun = this;
+        while (next !== run){
+            var after = next.mergedInto;
+            next.mergedInto = run;
+            next = after;
+        }
+        return run;
+    }
+
+    mergeInto(run: GradeRun): GradeRun {
+        run.length += this.length;
+        this.mergedInto = run;
+        return run;
+    }
+}
+
+// the grades of the latest TrialRecord of one page in a block
+class GradedRecord {
+    numCorrect: number;
+    incorrect: boolean;
+    // number of grades after the last incorrect one
+    trailing: number;
+    // if incorrect, the run of grades just before this record; otherwise the
+    // run this record's grades are part of
+    run: GradeRun;
+    previousIncorrect: GradedRecord = null;
+    nextIncorrect: GradedRecord = null;
+    superseded: boolean = false;
+
+    constructor(public grades: boolean[]){
+        this.numCorrect = _.compact(grades).length;
+        var lastIncorrect = _.lastIndexOf(grades, false);
+        this.incorrect = lastIncorrect > -1;
+        this.trailing = grades.length - (lastIncorrect + 1);
+    }
+}
+
+/* The grades of the latest iteration of each page in a block, kept up to date
+   by ExperimentRecord.addRecord so that criteria can be checked without
+   looking through every record. Records are added in the order they were
+   displayed, so they're kept in order by start time without sorting. */
+class BlockGrades {
+    private latest = {}; // {pageID: GradedRecord}
+    private records: GradedRecord[] = []; // in order added, superseded ones included
+    private numGraded: number = 0;
+    private numCorrect: number = 0;
+    private lastIncorrect: GradedRecord = null;
+    private currentRun: GradeRun = new GradeRun(); // grades since lastIncorrect
+
+    add(trialRecord: TrialRecord): void {
+        var pageID = trialRecord.getPageID();
+        if (_.has(this.latest, pageID)){
+            this.supersede(this.latest[pageID]);
+        }
+        var record = new GradedRecord(trialRecord.getGrades());
+        this.latest[pageID] = record;
+        this.records.push(record);
+        this.numGraded += record.grades.length;
+        this.numCorrect += record.numCorrect;
+        record.run = this.currentRun;
+        if (record.incorrect){
+            record.previousIncorrect = this.lastIncorrect;
+            if (this.lastIncorrect){
+                this.lastIncorrect.nextIncorrect = record;
+            }
+            this.lastIncorrect = record;
+            this.currentRun = new GradeRun();
+        } else {
+            this.currentRun.length += record.grades.length;
+        }
+    }
+
+    private supersede(record: GradedRecord): void {
+        record.superseded = true;
+        this.numGraded -= record.grades.length;
+        this.numCorrect -= record.numCorrect;
+        if (!record.incorrect){
+            record.run.root().length -= record.grades.length;
+            return;
+        }
+        // the runs on either side of the record's incorrect answers become one
+        if (record.nextIncorrect){
+            record.nextIncorrect.run = record.run.mergeInto(record.nextIncorrect.run);
+            record.nextIncorrect.previousIncorrect = record.previousIncorrect;
+        } else {
+            this.currentRun = record.run.mergeInto(this.currentRun);
+            this.lastIncorrect = record.previousIncorrect;
+        }
+        if (record.previousIncorrect){
+            record.previousIncorrect.nextIncorrect = record.nextIncorrect;
+        }
+    }
+
+    percentCorrect(): number {
+        return this.numCorrect / this.numGraded;
+    }
+
+    streak(): number {
+        return (this.lastIncorrect ? this.lastIncorrect.trailing : 0) + this.currentRun.length;
+    }
+
+    getGrades(): boolean[] {
+        var current = _.reject(this.records, (r: GradedRecord) => {return r.superseded});
+        return _.flatten(_.pluck(current, 'grades'));
+    }
+}
@@ -32,17 +32,58 @@ function getFeedback(feedback, ident: string, item: Item): Statement{
     }
 }
 
+/* Returns the element displaying resource on page, using the one the
+ * page's Prefetcher loaded if there is one, and records whether it had
+ * finished loading. */
 function makeResource(resource, page): any { // TODO Resource enum
+    var block = page.block || {};
+    resource = normalizeResource(resource, block.resourceFiles);
+    var res = block.prefetcher ? block.prefetcher.take(resource) : null;
+    if (res && isLoaded(res)){
+        page.record.addCachedResource(resource.name);
+    }
+    res = res || loadResource(resource);
+    if (resource.mediaType !== 'img') {
+        if (resource.autoplay){
+            res.autoplay = true;
+        }
+        if (resource.controls){
+            res.controls = true;
+        } else {
+            res.autoplay = true; // can't play without at least one of controls and autoplay
+        }
+        if (resource.required){
+            page.waitForResource();
+            $(res).on('ended', (e: Event) => {page.ready()});
+        }
+    }
+    return res;
+}
+
+/* resource as an object with a source and mediaType. name is the source it
+ * was given; if it was bundled by the compiler, source is where the bundled
+ * copy is, from files, {name: {url, mediaType, bytes}}. */
+function normalizeResource(resource, files = {}){
     var fileTypeMap = {'jpg': 'img', 'jpeg': 'img', 'png': 'img', 'pdf':
         'img', 'gif': 'img', 'mp3': 'audio', 'wav': 'audio', 'ogg': 'audio', 'mp4':
         'video', 'webm': 'video'};
     if (!_.has(resource, 'source')){ // if sampled string
         resource = {source: resource, autoplay: false, controls: true};
     }
+    resource = _.extend({name: resource.source}, resource);
+    if (_.has(files, resource.name)){
+        resource.source = files[resource.name].url;
+        resource.mediaType = resource.mediaType || files[resource.name].mediaType;
+    }
     if (!resource.mediaType) {
         var extension = resource.source.split('.').pop().toLowerCase();
         resource.mediaType = fileTypeMap[extension];
     }
+    return resource;
+}
+
+// an element that starts loading resource, not yet set up for display
+function loadResource(resource): any {
     if (resource.mediaType === 'img') {
         var image = new Image();
         image.src = resource.source;
@@ -52,22 +93,19 @@ function makeResource(resource, page): any { // TODO Resource enum
         var res = (resource.mediaType == 'audio') ? new Audio() : document.createElement('video');
         res.src = resource.source;
         res.preload = 'auto'; // this is default but just in case
-        if (resource.autoplay){
-            res.autoplay = true;
-        }
-        if (resource.controls){
-            res.controls = true;
-        } else {
-            res.autoplay = true; // can't play without at least one of controls and autoplay
-        }
-        if (resource.required){
-            page.waitForResource();
-            $(res).on('ended', (e: Event) => {page.ready()});
-        }
         return res;
     }
 }
 
+// whether property, as given in the JSON, is sampled from a bank in any part
+function isSampled(property): boolean{
+    if (_.isArray(property)){
+        return _.any(property, isSampled);
+    } else {
+        return _.isObject(property) && _.has(property, 'sampleFrom');
+    }
+}
+
 function setOrSample(property, block: Block){
     if (_.isObject(property) && _.has(property, 'sampleFrom')){
         return sampleFromBank(block, property);